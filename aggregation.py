@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from section_planner import count_tokens, truncate_to_tokens
+
+
+def chunk_items(items, fan_in, max_tokens, model_name="gpt-3.5-turbo"):
+    """
+    Group items into chunks of at most fan_in items and max_tokens tokens, keeping their order.
+
+    Items longer than half of max_tokens are truncated, so every chunk holds at least two items and each level
+    of the reduction at least halves the number of items.
+
+    Args:
+        items (list of str): The items to group.
+        fan_in (int): Maximum number of items per chunk.
+        max_tokens (int): Maximum number of tokens per chunk.
+        model_name (str): Name of the OpenAI model.
+
+    Returns:
+        list: The chunks, each a list of items.
+    """
+    chunks = []
+    chunk_tokens = 0
+    for item in items:
+        item = truncate_to_tokens(item, max_tokens // 2, model_name)
+        tokens = count_tokens(item, model_name)
+        if chunks and len(chunks[-1]) < fan_in and chunk_tokens + tokens <= max_tokens:
+            chunks[-1].append(item)
+            chunk_tokens += tokens
+        else:
+            chunks.append([item])
+            chunk_tokens = tokens
+    return chunks
+
+
+def tree_reduce(items, reduce_chunk, to_item, fan_in=8, max_tokens=2048, model_name="gpt-3.5-turbo"):
+    """
+    Reduce a list of texts to one result with a tree of LLM calls.
+
+    The items are grouped into chunks, all chunks of a level are reduced in parallel and the results of a level
+    are the items of the next one, until a single chunk is left. The latency grows with the logarithm of the
+    number of items to the base fan_in.
+
+    Args:
+        items (list of str): The texts to reduce.
+        reduce_chunk (callable): Reduces a list of items to a result, returns None if the reduction failed.
+        to_item (callable): Converts the result of an intermediate reduction back into an item.
+        fan_in (int): Maximum number of items reduced in one call.
+        max_tokens (int): Maximum number of item tokens per call.
+        model_name (str): Name of the OpenAI model.
+
+    Returns:
+        The result of the final reduction or None if it failed.
+    """
+    fan_in = max(2, fan_in)
+    chunks = chunk_items(items, fan_in, max_tokens, model_name)
+    while len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            results = list(executor.map(instrumentation.propagate(reduce_chunk), chunks))
+        # A failed intermediate reduction passes its items on instead of dropping them
+        next_items = []
+        for chunk, result in zip(chunks, results):
+            next_items.append(to_item(result) if result is not None else "\n".join(chunk))
+        chunks = chunk_items(next_items, fan_in, max_tokens, model_name)
+    if not chunks:
+        return None
+    return reduce_chunk(chunks[0])
@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import threading
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import arxiv
+
+
+def normalize_title(title):
+    """
+    Normalize a title for matching: lower case, only letters and digits, single spaces.
+
+    Args:
+        title (str): The title to normalize.
+
+    Returns:
+        str: The normalized title.
+    """
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title.lower()).split())
+
+
+def title_similarity(title, candidate):
+    """
+    Compute the similarity of two titles between 0 and 1.
+
+    Args:
+        title (str): The normalized title that is looked up.
+        candidate (str): The normalized title of a search result.
+
+    Returns:
+        float: The similarity, 1 for identical titles.
+    """
+    matcher = SequenceMatcher(None, title, candidate, autojunk=False)
+    # quick_ratio is an upper bound of ratio and much cheaper, so most wrong candidates are rejected early
+    if matcher.quick_ratio() < 0.5:
+        return 0.0
+    return matcher.ratio()
+
+
+def arxiv_search(query, max_results):
+    """
+    Search arXiv and return the results.
+
+    Args:
+        query (str): The arXiv query.
+        max_results (int): The maximum number of results to retrieve.
+
+    Returns:
+        list of arxiv.Result: The search results.
+    """
+    search = arxiv.Search(
+        query=query,
+        max_results=max_results,
+        sort_by=arxiv.SortCriterion.Relevance,
+        sort_order=arxiv.SortOrder.Descending
+    )
+    return list(search.results())
+
+
+class ArxivTitleResolver:
+    """
+    Resolve paper titles to arXiv papers with batched searches and a local cache.
+
+    Several titles are looked up with one query of the form `ti:"..." OR ti:"..."` and every result is matched
+    against all titles of the batch with a fuzzy title similarity, so a bad first hit is rejected instead of
+    downloaded. Titles that are not found in their batch are searched once more on their own. Resolved titles,
+    including titles without a match, are stored in a JSON file and never searched again.
+    """
+
+    def __init__(self, cache_path="arxiv_titles.json", search=arxiv_search, batch_size=10, min_similarity=0.9):
+        """
+        Args:
+            cache_path (str): Path to the JSON file caching the resolved titles. None disables the cache.
+            search (callable): Function taking a query and the maximum number of results and returning results
+                with title, pdf_url and get_short_id, e.g. a stub for tests.
+            batch_size (int): Number of titles searched with one query.
+            min_similarity (float): Minimum title similarity of a result to be accepted as a match.
+        """
+        self.cache_path = cache_path
+        self.search = search
+        self.batch_size = max(1, batch_size)
+        self.min_similarity = min_similarity
+        self.queries = 0
+        self._lock = threading.Lock()
+        self._cache = {}
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                self._cache = json.load(f)
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        Path(self.cache_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def _match(self, normalized_titles, results):
+        matches = {}
+        for result in results:
+            candidate = normalize_title(result.title)
+            for normalized_title in normalized_titles:
+                score = title_similarity(normalized_title, candidate)
+                best = matches.get(normalized_title)
+                if score >= self.min_similarity and (best is None or score > best["score"]):
+                    matches[normalized_title] = {"arxiv_id": result.get_short_id(), "title": result.title,
+                                                 "pdf_url": result.pdf_url, "score": score}
+        return matches
+
+    def _search_titles(self, normalized_titles, max_results_per_title):
+        query = " OR ".join(f'ti:"{normalized_title}"' for normalized_title in normalized_titles)
+        self.queries += 1
+        try:
+            results = self.search(query, max_results_per_title * len(normalized_titles))
+        except Exception as e:
+            print(f"arXiv search failed: {e}")
+            return None
+        return self._match(normalized_titles, results)
+
+    def resolve(self, titles):
+        """
+        Resolve titles to arXiv papers.
+
+        Args:
+            titles (list of str): The titles to resolve.
+
+        Returns:
+            dict: Mapping of each title to a dict with arxiv_id, title, pdf_url and score, or None if no
+                matching paper was found.
+        """
+        normalized = {title: normalize_title(title) for title in titles}
+        with self._lock:
+            pending = sorted({n for n in normalized.values() if n and n not in self._cache})
+
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                matches = self._search_titles(batch, 2)
+                if matches is None:
+                    continue
+                for normalized_title in batch:
+                    match = matches.get(normalized_title)
+                    if match is None and len(batch) > 1:
+                        # A title can be crowded out by the results of the other titles of its batch
+                        single_matches = self._search_titles([normalized_title], 3)
+                        if single_matches is None:
+                            continue
+                        match = single_matches.get(normalized_title)
+                    self._cache[normalized_title] = match
+                self._save()
+
+            return {title: self._cache.get(normalized[title]) for title in titles}
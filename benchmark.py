@@ -0,0 +1,386 @@
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+import langchain
+import openai
+from langchain.chat_models.base import BaseChatModel
+from langchain.pydantic_v1 import PrivateAttr
+from langchain.schema import ChatResult
+from langchain.schema.messages import AIMessage
+from langchain.schema.output import ChatGeneration
+
+# main.py refuses to start without an API key, the benchmark never sends a request to OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import instrumentation
+import main as pipeline
+from instrumentation import percentile
+from llm_scheduler import TokenBucket
+from section_planner import count_tokens
+
+# Words the synthetic papers and the fake answers are made of
+VOCABULARY = ("hallucination retrieval model language metric faithfulness factual evaluation benchmark generation "
+              "knowledge answer question context mitigation decoding entailment consistency score human annotation "
+              "dataset summary reference grounding verification").split()
+
+
+def synthetic_text(rng, n_words):
+    """
+    Generate text of sentences made of random words of VOCABULARY.
+
+    Args:
+        rng (random.Random): The random number generator.
+        n_words (int): Number of words.
+
+    Returns:
+        str: The text.
+    """
+    words = [rng.choice(VOCABULARY) for _ in range(n_words)]
+    for i in range(11, n_words, 12):
+        words[i] += "."
+    return " ".join(words)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatOpenAI with a configurable latency and injected API errors.
+
+    The answer is a JSON code block with a value for every key of the format instructions in the prompt, so the
+    output parsers of all chains accept it. Every call sleeps for latency plus seconds_per_1k_tokens per 1000
+    prompt and completion tokens, and fails with a rate-limit or context-length error with the given
+    probabilities. With quota_rpm, calls beyond that many requests per minute fail with a rate-limit error like an
+    exhausted account quota; like the API, the quota allows bursts of llm_scheduler.BURST_SECONDS only. The errors are drawn from a random number generator seeded with seed, and the answer text is
+    derived from the prompt, so repeated runs are reproducible.
+    """
+
+    model_name: str = "gpt-3.5-turbo"
+    latency: float = 0.05
+    seconds_per_1k_tokens: float = 0.02
+    completion_tokens: int = 200
+    rate_limit_rate: float = 0.0
+    context_error_rate: float = 0.0
+    context_window: Optional[int] = None
+    quota_rpm: Optional[float] = None
+    seed: int = 0
+    calls: int = 0
+    _rng: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default=None)
+    _quota: Any = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._quota = TokenBucket(self.quota_rpm) if self.quota_rpm else None
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark-chat-model"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name, "completion_tokens": self.completion_tokens, "seed": self.seed}
+
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        prompt_tokens = count_tokens(prompt, self.model_name)
+        with self._lock:
+            self.calls += 1
+            draw = self._rng.random()
+
+        if self._quota is not None and not self._quota.try_take(1):
+            time.sleep(self.latency)
+            raise openai.error.RateLimitError(f"Rate limit reached: {self.quota_rpm} requests per minute")
+        if draw < self.rate_limit_rate:
+            time.sleep(self.latency)
+            raise openai.error.RateLimitError("Rate limit reached for requests (injected by the benchmark)")
+        too_long = self.context_window is not None and prompt_tokens + self.completion_tokens > self.context_window
+        if too_long or draw < self.rate_limit_rate + self.context_error_rate:
+            time.sleep(self.latency)
+            raise openai.error.InvalidRequestError(
+                f"This model's maximum context length is {self.context_window} tokens. However, your messages "
+                f"resulted in {prompt_tokens} tokens (injected by the benchmark)", "messages")
+
+        keys = re.findall(r'"(\w+)": string', prompt)
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        words_per_key = max(1, int(self.completion_tokens * 0.75) // max(1, len(keys)))
+        answer = "```json\n" + json.dumps({key: synthetic_text(rng, words_per_key) for key in keys}) + "\n```"
+        completion_tokens = count_tokens(answer, self.model_name)
+
+        time.sleep(self.latency + self.seconds_per_1k_tokens * (prompt_tokens + completion_tokens) / 1000)
+        token_usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                       "total_tokens": prompt_tokens + completion_tokens}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))],
+                          llm_output={"token_usage": token_usage, "model_name": self.model_name})
+
+
+def uploaded_file(body, content_type):
+    """
+    Extract the content of the first file of a multipart/form-data request body.
+
+    Args:
+        body (bytes): The request body.
+        content_type (str): The Content-Type header with the multipart boundary.
+
+    Returns:
+        bytes: The file content, or the whole body if it is not a multipart body.
+    """
+    match = re.search(r"boundary=\"?([^\";]+)", content_type or "")
+    if not match:
+        return body
+    for part in body.split(b"--" + match.group(1).encode("latin-1")):
+        headers, separator, content = part.partition(b"\r\n\r\n")
+        if separator and b"filename=" in headers:
+            return content[:-2] if content.endswith(b"\r\n") else content
+    return body
+
+
+class FakeScienceParseHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answer POST /v1 like science-parse with a synthetic paper derived from the content of the uploaded PDF, so the
+    same PDF always parses to the same paper.
+
+    The number of sections, the words per section and the parse latency are read from the attributes of the
+    server, see start_fake_science_parse.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/v1":
+            self.send_error(404)
+            return
+        time.sleep(self.server.parse_latency)
+        # Seeded with the PDF itself, not the request body, whose multipart boundary is random
+        pdf = uploaded_file(body, self.headers.get("Content-Type"))
+        rng = random.Random(hashlib.sha256(pdf).hexdigest())
+        paper = {
+            "title": synthetic_text(rng, 8).rstrip(".").title(),
+            "abstractText": synthetic_text(rng, 150),
+            "sections": [{"heading": f"{i + 1} {synthetic_text(rng, 3).rstrip('.').title()}",
+                          "text": synthetic_text(rng, self.server.section_words)}
+                         for i in range(self.server.sections_per_paper)],
+            "references": [],
+        }
+        data = json.dumps(paper).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_fake_science_parse(sections_per_paper=10, section_words=400, parse_latency=0.2):
+    """
+    Start a fake science-parse server on a free local port in a background thread.
+
+    Args:
+        sections_per_paper (int): Number of sections of every synthetic paper.
+        section_words (int): Number of words of every section.
+        parse_latency (float): Seconds every parse request takes.
+
+    Returns:
+        http.server.ThreadingHTTPServer: The running server; call shutdown() to stop it.
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeScienceParseHandler)
+    server.sections_per_paper = sections_per_paper
+    server.section_words = section_words
+    server.parse_latency = parse_latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_corpus(path, n_papers):
+    """
+    Write small PDF files with distinct contents, so every paper is parsed to a different synthetic paper.
+
+    Args:
+        path (str): Directory the PDF files are written to.
+        n_papers (int): Number of PDF files.
+
+    Returns:
+        None
+    """
+    Path(path).mkdir(parents=True, exist_ok=True)
+    for i in range(n_papers):
+        with open(Path(path, f"paper_{i:04d}.pdf"), "wb") as f:
+            f.write(f"%PDF-1.4\n% synthetic benchmark paper {i}\n%%EOF\n".encode("utf-8"))
+
+
+def run_once(n_papers, max_concurrent_papers, servers, llm_options, max_concurrent_llm_calls=None,
+             section_mode="sequential", requests_per_minute=None, tokens_per_minute=None):
+    """
+    Run the full pipeline of main.py once on a fresh synthetic corpus, without any cache or checkpoint.
+
+    Args:
+        n_papers (int): Number of papers of the corpus.
+        max_concurrent_papers (int): Number of papers processed at the same time.
+        servers (list of http.server.ThreadingHTTPServer): The fake science-parse servers.
+        llm_options (dict): Keyword arguments of FakeChatModel.
+        max_concurrent_llm_calls (int): Maximum number of LLM calls in flight. None means no limit.
+        section_mode (str): How the sections of a paper are scheduled, one of main.SECTION_MODES.
+        requests_per_minute (float): Request rate limit of the LLM scheduler. None means no limit.
+        tokens_per_minute (float): Token rate limit of the LLM scheduler. None means no limit.
+
+    Returns:
+        dict: Throughput, LLM calls per paper, latency percentiles and failures of the run.
+    """
+    llm = FakeChatModel(**llm_options)
+    langchain.llm_cache = None
+    tracer = instrumentation.configure()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_dir = os.path.join(tmp_dir, "pdfs")
+        output_dir = os.path.join(tmp_dir, "parsed_papers")
+        make_corpus(pdf_dir, n_papers)
+        os.mkdir(output_dir)
+
+        start = time.perf_counter()
+        failures = pipeline.main(pdf_dir, output_dir, max_concurrent_papers, max_concurrent_llm_calls, llm=llm,
+                                 section_mode=section_mode,
+                                 parse_endpoints=[f"http://127.0.0.1:{server.server_port}" for server in servers],
+                                 requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+        wall_time = time.perf_counter() - start
+
+    papers = sorted(record["wall_time"] for record in tracer.records if record["stage"] == "paper")
+    calls = [record for record in tracer.records if record["stage"] == "llm_call"]
+    call_times = sorted(record["wall_time"] for record in calls)
+    call_errors = [record["reason"].split(":")[0] for record in calls if record["status"] == "error"]
+    sections = [record for record in tracer.records if record["stage"] == "process_section"]
+    processed = n_papers - len(failures)
+    return {
+        "papers": n_papers,
+        "max_concurrent_papers": max_concurrent_papers,
+        "processed": processed,
+        "failed": len(failures),
+        "wall_time": wall_time,
+        "papers_per_min": processed / wall_time * 60,
+        "calls_per_paper": len(calls) / max(1, n_papers),
+        "paper_p50": percentile(papers, 50),
+        "paper_p95": percentile(papers, 95),
+        "call_p50": percentile(call_times, 50),
+        "call_p95": percentile(call_times, 95),
+        "retries": sum(record.get("retries", 0) for record in calls),
+        "rate_limit_errors": pipeline.llm_scheduler.rate_limit_errors,
+        "context_errors": call_errors.count("InvalidRequestError"),
+        "dropped_sections": sum(1 for record in sections if record["status"] != "ok"),
+        "prompt_tokens": sum(record.get("prompt_tokens", 0) for record in calls),
+    }
+
+
+def format_results(results):
+    """
+    Format benchmark results as a plain text table.
+
+    Args:
+        results (list of dict): The results of run_once.
+
+    Returns:
+        str: The table.
+    """
+    columns = ["papers", "max_concurrent_papers", "processed", "failed", "wall_time", "papers_per_min",
+               "calls_per_paper", "paper_p50", "paper_p95", "call_p50", "call_p95", "retries", "rate_limit_errors",
+               "context_errors", "dropped_sections"]
+    lines = ["".join(column.rjust(len(column) + 2) for column in columns)]
+    for result in results:
+        cells = []
+        for column in columns:
+            value = result[column]
+            text = "-" if value is None else f"{value:.2f}" if isinstance(value, float) else str(value)
+            cells.append(text.rjust(len(column) + 2))
+        lines.append("".join(cells))
+    return "\n".join(lines)
+
+
+def main(corpus_sizes, concurrencies, llm_options, max_concurrent_llm_calls=None, section_mode="sequential",
+         sections_per_paper=10, section_words=400, parse_latency=0.2, output_file=None, requests_per_minute=None,
+         tokens_per_minute=None, parse_backends=1):
+    """
+    Benchmark the pipeline offline for every combination of corpus size and paper concurrency.
+
+    Args:
+        corpus_sizes (list of int): Numbers of papers of the synthetic corpora.
+        concurrencies (list of int): Numbers of papers processed at the same time.
+        llm_options (dict): Keyword arguments of FakeChatModel.
+        max_concurrent_llm_calls (int): Maximum number of LLM calls in flight. None means no limit.
+        section_mode (str): How the sections of a paper are scheduled, one of main.SECTION_MODES.
+        sections_per_paper (int): Number of sections of every synthetic paper.
+        section_words (int): Number of words of every section.
+        parse_latency (float): Seconds every science-parse request takes.
+        output_file (str): JSON file the results are written to. None only prints them.
+        requests_per_minute (float): Request rate limit of the LLM scheduler. None means no limit.
+        tokens_per_minute (float): Token rate limit of the LLM scheduler. None means no limit.
+        parse_backends (int): Number of fake science-parse servers the PDFs are spread over.
+
+    Returns:
+        list of dict: The results of every run.
+    """
+    servers = [start_fake_science_parse(sections_per_paper, section_words, parse_latency)
+               for _ in range(max(1, parse_backends))]
+    results = []
+    try:
+        for n_papers in corpus_sizes:
+            for max_concurrent_papers in concurrencies:
+                results.append(run_once(n_papers, max_concurrent_papers, servers, llm_options,
+                                        max_concurrent_llm_calls, section_mode, requests_per_minute,
+                                        tokens_per_minute))
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    print(format_results(results))
+    if output_file:
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark main.py offline with a fake LLM and a fake science-parse server.")
+    parser.add_argument('--corpus_sizes', nargs='+', type=int, default=[5, 20], help="Numbers of papers of the synthetic corpora")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4], help="Numbers of papers processed at the same time")
+    parser.add_argument('--max_concurrent_llm_calls', type=int, default=None, help="Maximum number of LLM calls in flight across all papers")
+    parser.add_argument('--section_mode', type=str, default="sequential", choices=pipeline.SECTION_MODES, help="How the sections of a paper are scheduled")
+    parser.add_argument('--sections', type=int, default=10, help="Number of sections of every synthetic paper")
+    parser.add_argument('--section_words', type=int, default=400, help="Number of words of every section")
+    parser.add_argument('--parse_latency', type=float, default=0.2, help="Seconds every science-parse request takes")
+    parser.add_argument('--parse_backends', type=int, default=1, help="Number of fake science-parse servers the PDFs are spread over")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fixed seconds every LLM call takes")
+    parser.add_argument('--seconds_per_1k_tokens', type=float, default=0.02, help="Additional seconds per 1000 prompt and completion tokens of an LLM call")
+    parser.add_argument('--completion_tokens', type=int, default=200, help="Approximate number of tokens of every LLM answer")
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help="Probability that an LLM call fails with a rate-limit error")
+    parser.add_argument('--context_error_rate', type=float, default=0.0, help="Probability that an LLM call fails with a context-length error")
+    parser.add_argument('--context_window', type=int, default=None, help="Fail LLM calls whose prompt and answer exceed this many tokens")
+    parser.add_argument('--quota_rpm', type=float, default=None, help="Requests per minute the fake model accepts before it answers with rate-limit errors")
+    parser.add_argument('--requests_per_minute', type=float, default=None, help="Request rate limit of the LLM scheduler of main.py")
+    parser.add_argument('--tokens_per_minute', type=float, default=None, help="Token rate limit of the LLM scheduler of main.py")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the injected errors")
+    parser.add_argument('--output_file', type=str, default=None, help="JSON file the results are written to")
+
+    args = parser.parse_args()
+    fake_llm_options = {
+        "latency": args.latency,
+        "seconds_per_1k_tokens": args.seconds_per_1k_tokens,
+        "completion_tokens": args.completion_tokens,
+        "rate_limit_rate": args.rate_limit_rate,
+        "context_error_rate": args.context_error_rate,
+        "context_window": args.context_window,
+        "quota_rpm": args.quota_rpm,
+        "seed": args.seed,
+    }
+    main(args.corpus_sizes, args.concurrency, fake_llm_options, args.max_concurrent_llm_calls, args.section_mode,
+         args.sections, args.section_words, args.parse_latency, args.output_file, args.requests_per_minute,
+         args.tokens_per_minute, args.parse_backends)
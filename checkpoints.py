@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from models_and_prompts import SETTINGS, TEMPLATE_VERSION
+
+
+def file_sha256(path):
+    """
+    Compute the SHA-256 hash of a file.
+
+    Args:
+        path (str or Path): Path to the file.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_hash(settings=SETTINGS, template_version=TEMPLATE_VERSION, processing=None):
+    """
+    Compute a hash of the prompt settings and processing parameters, so outputs produced with other prompts or
+    another section scheduling are not reused.
+
+    Args:
+        settings (dict): The prompt settings as defined in models_and_prompts.SETTINGS.
+        template_version (str): Version of the templates.
+        processing (dict): Parameters that change the output for the same prompts, e.g. the section mode and the
+            triage threshold. Their values must be JSON serializable.
+
+    Returns:
+        str: The hex digest of the settings.
+    """
+    serializable = {
+        name: {
+            "template": template_settings["template"],
+            "response_schemas": [(schema.name, schema.description) for schema in template_settings["response_schemas"]],
+            "input_variables": template_settings["input_variables"],
+        }
+        for name, template_settings in settings.items()
+    }
+    content = json.dumps([template_version, serializable] + ([processing] if processing else []), sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def checkpoint_path(checkpoint_dir, file):
+    """
+    Return the path of the checkpoint belonging to a PDF file.
+
+    Args:
+        checkpoint_dir (str): Directory where the checkpoints are stored.
+        file (str or Path): Path to the PDF file.
+
+    Returns:
+        Path: Path to the checkpoint file.
+    """
+    return Path(checkpoint_dir, Path(file).stem + ".json")
+
+
+def load_checkpoint(path, pdf_sha256, prompt_settings_hash):
+    """
+    Load a checkpoint if it belongs to the same PDF content, prompt settings and processing parameters.
+
+    Args:
+        path (Path): Path to the checkpoint file.
+        pdf_sha256 (str): SHA-256 hash of the PDF file.
+        prompt_settings_hash (str): Hash of the prompt settings and processing parameters as returned by
+            settings_hash.
+
+    Returns:
+        dict: The checkpoint or None if there is no usable checkpoint.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get("pdf_sha256") != pdf_sha256 or checkpoint.get("settings_hash") != prompt_settings_hash:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    Save a checkpoint atomically, so a crash while writing never leaves a broken checkpoint behind.
+
+    Args:
+        path (Path): Path to the checkpoint file.
+        checkpoint (dict): The checkpoint to save.
+
+    Returns:
+        None
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import re
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from corpus_store import CorpusStore
+from models_and_prompts import CATALOG_SETTINGS
+
+# Section fields holding the names and the descriptions of each kind of catalog entry
+KINDS = {
+    "metrics": ("metrics", "metrics_description", "metric to detect or measure hallucinations"),
+    "mitigation": ("mitigation", "mitigation_description", "technique to mitigate hallucinations"),
+}
+# Maximum number of names and descriptions of a cluster sent to the LLM
+MAX_NAMES_PER_CALL = 10
+MAX_DESCRIPTIONS_PER_CALL = 5
+
+
+def iter_papers(dir_path=None, corpus_path=None):
+    """
+    Stream the parsed papers from a directory of JSON files or from a corpus store.
+
+    Args:
+        dir_path (str): The directory path where parsed papers are stored.
+        corpus_path (str): The directory of a corpus store. If given, it is read instead of dir_path.
+
+    Yields:
+        tuple: The key and the paper.
+    """
+    if corpus_path:
+        yield from CorpusStore(corpus_path).iter_records(sections=True, section_text=False)
+        return
+    for file in sorted(os.listdir(dir_path)):
+        if file.endswith(".json"):
+            with open(os.path.join(dir_path, file), "r", encoding="utf-8") as f:
+                yield file[:-len(".json")], json.load(f)
+
+
+def split_names(value):
+    """
+    Split the names field of a section into single names.
+
+    Args:
+        value (str or list): The names as returned by the LLM, e.g. "FactScore, SelfCheckGPT".
+
+    Returns:
+        list of str: The names.
+    """
+    if isinstance(value, list):
+        return [name for item in value for name in split_names(item)]
+    if not isinstance(value, str):
+        return []
+    return [name.strip(" .-*") for name in re.split(r"[,;\n]", value) if len(name.strip(" .-*")) > 1]
+
+
+def normalize_name(name):
+    """
+    Normalize a name for matching: lower case, only letters and digits, single spaces.
+
+    Args:
+        name (str): The name to normalize.
+
+    Returns:
+        str: The normalized name.
+    """
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name.lower()).split())
+
+
+def collect_entries(papers):
+    """
+    Collect the metric and mitigation mentions of all sections of all papers.
+
+    Args:
+        papers (iterable): Tuples of the key and the paper.
+
+    Returns:
+        list of dict: One entry per mention with kind, name, normalized name, description and paper.
+    """
+    entries = []
+    for key, paper in papers:
+        for section in paper.get("sections", []):
+            for kind, (names_field, description_field, _) in KINDS.items():
+                description = section.get(description_field) or ""
+                if not isinstance(description, str):
+                    description = json.dumps(description, ensure_ascii=False)
+                for name in split_names(section.get(names_field)):
+                    normalized = normalize_name(name)
+                    if normalized:
+                        entries.append({"kind": kind, "name": name, "normalized": normalized,
+                                        "description": description, "paper": key})
+    return entries
+
+
+def hashed_tfidf(texts, dim=4096, ngram=3):
+    """
+    Build L2-normalized TF-IDF vectors of character n-grams, hashed into a fixed number of dimensions.
+
+    Args:
+        texts (list of str): The texts to vectorize.
+        dim (int): Number of dimensions.
+        ngram (int): Length of the character n-grams.
+
+    Returns:
+        np.ndarray: One row per text.
+    """
+    counts = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        padded = f" {text} "
+        buckets = [zlib.crc32(padded[i:i + ngram].encode("utf-8")) % dim for i in range(len(padded) - ngram + 1)]
+        np.add.at(counts[row], buckets, 1)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    vectors = counts * idf.astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def cluster_vectors(vectors, threshold, block_size=1024):
+    """
+    Cluster vectors by linking every pair with a cosine similarity of at least threshold.
+
+    The similarities are computed block by block as matrix products, so memory stays bounded for large inputs.
+
+    Args:
+        vectors (np.ndarray): L2-normalized vectors, one per row.
+        threshold (float): Minimum cosine similarity of two linked vectors.
+        block_size (int): Number of rows compared at once.
+
+    Returns:
+        list of int: The cluster label of every row.
+    """
+    parent = list(range(len(vectors)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for start in range(0, len(vectors), block_size):
+        similarities = vectors[start:start + block_size] @ vectors.T
+        rows, columns = np.nonzero(similarities >= threshold)
+        for row, column in zip(rows + start, columns):
+            if column > row:
+                root_row, root_column = find(row), find(column)
+                if root_row != root_column:
+                    parent[root_column] = root_row
+    return [find(i) for i in range(len(vectors))]
+
+
+def build_clusters(entries, threshold=0.75):
+    """
+    Group the mentions of each kind into clusters of near-duplicate names.
+
+    Mentions with the same normalized name, ignoring spaces, are merged first, and only the distinct names are
+    vectorized and compared.
+
+    Args:
+        entries (list of dict): The mentions as returned by collect_entries.
+        threshold (float): Minimum cosine similarity of two names in one cluster.
+
+    Returns:
+        list of dict: The clusters with kind, the representative name, aliases, descriptions, papers and mentions.
+    """
+    clusters = []
+    for kind in KINDS:
+        by_name = defaultdict(list)
+        for entry in entries:
+            if entry["kind"] == kind:
+                by_name[entry["normalized"].replace(" ", "")].append(entry)
+        if not by_name:
+            continue
+        normalized_names = list(by_name)
+        labels = cluster_vectors(hashed_tfidf(normalized_names), threshold)
+
+        members = defaultdict(list)
+        for normalized_name, label in zip(normalized_names, labels):
+            members[label].extend(by_name[normalized_name])
+        for mentions in members.values():
+            name_counts = Counter(mention["name"] for mention in mentions)
+            descriptions = list(dict.fromkeys(mention["description"] for mention in mentions if mention["description"]))
+            clusters.append({
+                "kind": kind,
+                "name": name_counts.most_common(1)[0][0],
+                "description": descriptions[0] if descriptions else "",
+                "aliases": [name for name, _ in name_counts.most_common()],
+                "descriptions": descriptions,
+                "papers": sorted({mention["paper"] for mention in mentions}),
+                "mentions": len(mentions),
+            })
+    clusters.sort(key=lambda cluster: cluster["mentions"], reverse=True)
+    return clusters
+
+
+def canonicalize_clusters(clusters, max_concurrent_llm_calls=8, llm=None, requests_per_minute=None,
+                          tokens_per_minute=None, max_retries=6):
+    """
+    Ask the LLM for a canonical name and description of every cluster, one call per cluster.
+
+    The calls go through the LLM scheduler of main.py, so they share its rate limits, retries with backoff and
+    adaptive concurrency.
+
+    Args:
+        clusters (list of dict): The clusters as returned by build_clusters. They are updated in place.
+        max_concurrent_llm_calls (int): Maximum number of LLM calls in flight at the same time.
+        llm (BaseChatModel): Language model to use instead of gpt-3.5-turbo.
+        requests_per_minute (float): Requests per minute allowed for the OpenAI account. None means no limit.
+        tokens_per_minute (float): Tokens per minute allowed for the OpenAI account. None means no limit.
+        max_retries (int): Number of times an LLM call is sent again after a rate limit or a transient error.
+
+    Returns:
+        None
+    """
+    # main checks the OpenAI API key on import, so it is only imported when the LLM is actually used
+    import langchain
+    import main as pipeline
+
+    llm = pipeline.initialize_llm(llm, max_concurrent_llm_calls, requests_per_minute=requests_per_minute,
+                                  tokens_per_minute=tokens_per_minute, max_retries=max_retries)
+    chain, output_parser = pipeline.initialize_chain(CATALOG_SETTINGS["canonicalize_entry"], llm, "canonicalize_entry")
+
+    def canonicalize(cluster):
+        try:
+            query = pipeline.run_chain(chain, kind=KINDS[cluster["kind"]][2],
+                                       names=cluster["aliases"][:MAX_NAMES_PER_CALL],
+                                       descriptions=cluster["descriptions"][:MAX_DESCRIPTIONS_PER_CALL])
+        except Exception as e:
+            print(f"Failed to canonicalize {cluster['name']}: {e}")
+            return
+        try:
+            output = output_parser.parse(query)
+        except langchain.schema.output_parser.OutputParserException:
+            try:
+                output = output_parser.parse(query + "```")
+            except langchain.schema.output_parser.OutputParserException as e:
+                print(e)
+                return
+        cluster["name"] = output["canonical_name"]
+        cluster["description"] = output["canonical_description"]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrent_llm_calls)) as executor:
+        list(executor.map(canonicalize, clusters))
+    print(f"LLM scheduler: {pipeline.llm_scheduler.stats()}")
+
+
+def main(dir_path, output_file, corpus_path=None, threshold=0.75, use_llm=True, max_concurrent_llm_calls=8,
+         requests_per_minute=None, tokens_per_minute=None, max_retries=6):
+    """
+    Build a deduplicated catalog of the metrics and mitigation techniques of the whole corpus.
+
+    Args:
+        dir_path (str): The directory path where parsed papers are stored.
+        output_file (str): Path of the JSON file the catalog is written to.
+        corpus_path (str): The directory of a corpus store. If given, it is read instead of dir_path.
+        threshold (float): Minimum cosine similarity of two names in one cluster.
+        use_llm (bool): Whether to ask the LLM for a canonical name and description of every cluster.
+        max_concurrent_llm_calls (int): Maximum number of LLM calls in flight at the same time.
+        requests_per_minute (float): Requests per minute allowed for the OpenAI account. None means no limit.
+        tokens_per_minute (float): Tokens per minute allowed for the OpenAI account. None means no limit.
+        max_retries (int): Number of times an LLM call is sent again after a rate limit or a transient error.
+
+    Returns:
+        None
+    """
+    entries = collect_entries(iter_papers(dir_path, corpus_path))
+    clusters = build_clusters(entries, threshold)
+    print(f"Clustered {len(entries)} mentions into {len(clusters)} catalog entries")
+
+    if use_llm:
+        canonicalize_clusters(clusters, max_concurrent_llm_calls, requests_per_minute=requests_per_minute,
+                              tokens_per_minute=tokens_per_minute, max_retries=max_retries)
+
+    catalog = [{field: cluster[field] for field in ["kind", "name", "description", "aliases", "papers", "mentions"]}
+               for cluster in clusters]
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a deduplicated catalog of the metrics and mitigation techniques of all parsed papers.")
+    parser.add_argument('--dir_path', type=str, default="parsed_papers", help="Path to the directory where parsed papers are stored")
+    parser.add_argument('--corpus_path', type=str, default=None, help="Path to a corpus store written by main.py. If given, it is read instead of dir_path")
+    parser.add_argument('--output_file', type=str, default="catalog.json", help="JSON file the catalog is written to")
+    parser.add_argument('--threshold', type=float, default=0.75, help="Minimum cosine similarity of two names in one cluster")
+    parser.add_argument('--no_llm', action='store_true', help="Only cluster locally, without asking the LLM for canonical descriptions")
+    parser.add_argument('--max_concurrent_llm_calls', type=int, default=8, help="Maximum number of LLM calls in flight at the same time")
+    parser.add_argument('--requests_per_minute', type=float, default=None, help="Requests per minute allowed for the OpenAI account")
+    parser.add_argument('--tokens_per_minute', type=float, default=None, help="Tokens per minute allowed for the OpenAI account")
+    parser.add_argument('--max_retries', type=int, default=6, help="Number of times an LLM call is retried after a rate limit or a transient error")
+
+    args = parser.parse_args()
+    main(args.dir_path, args.output_file, args.corpus_path, args.threshold, not args.no_llm, args.max_concurrent_llm_calls,
+         args.requests_per_minute, args.tokens_per_minute, args.max_retries)
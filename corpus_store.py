@@ -0,0 +1,191 @@
+import json
+import threading
+from pathlib import Path
+
+# The column groups of a paper, each stored in its own append-only JSONL file
+PAPERS_FILE = "papers.jsonl"
+SECTIONS_FILE = "sections.jsonl"
+TEXTS_FILE = "texts.jsonl"
+INDEX_FILE = "index.jsonl"
+
+
+class CorpusStore:
+    """
+    Append-only store for the parsed papers of a whole corpus.
+
+    A paper is split into three column groups, each appended as one compact JSON line to its own file: the
+    paper-level fields (title, aggregates, references, ...), the section results without their text, and the raw
+    section texts. An index file records the offset and length of every line, so a single paper can be read with
+    a few seeks and consumers only parse the column groups they need. Writing a paper again appends a new version;
+    the index always points to the latest one.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Directory of the store. It is created if it doesn't exist.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = {}
+        for file_name in (PAPERS_FILE, SECTIONS_FILE, TEXTS_FILE, INDEX_FILE):
+            self._truncate_torn_line(file_name)
+        index_path = self.path / INDEX_FILE
+        if index_path.exists():
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._index[entry["key"]] = entry
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        """Return the keys of all papers in the store, in the order they were first written."""
+        return list(self._index)
+
+    def _truncate_torn_line(self, file_name):
+        # A process killed while appending leaves a line without its newline. The index never points to it, but the
+        # next line would be appended to the same physical line, so the torn bytes are cut off
+        path = self.path / file_name
+        if not path.exists():
+            return
+        with open(path, "r+b") as f:
+            size = f.seek(0, 2)
+            end = size
+            # Search backwards for the last newline, a block at a time
+            while end > 0:
+                start = max(0, end - 65536)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                print(f"Removing {size - end} bytes of an incomplete line at the end of {path}")
+                f.truncate(end)
+
+    def _append_line(self, file_name, record):
+        data = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(self.path / file_name, "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        return [offset, len(data)]
+
+    def append(self, key, paper):
+        """
+        Append a paper to the store.
+
+        Args:
+            key (str): Unique key of the paper, e.g. the name of the PDF file without extension.
+            paper (dict): The parsed paper as produced by main.py.
+
+        Returns:
+            None
+        """
+        sections = paper.get("sections", [])
+        paper_fields = {field: value for field, value in paper.items() if field != "sections"}
+        section_results = [{field: value for field, value in section.items() if field != "text"}
+                           for section in sections]
+        section_texts = [section.get("text", "") for section in sections]
+
+        with self._lock:
+            entry = {
+                "key": key,
+                "papers": self._append_line(PAPERS_FILE, paper_fields),
+                "sections": self._append_line(SECTIONS_FILE, section_results),
+                "texts": self._append_line(TEXTS_FILE, section_texts),
+            }
+            # The index line is written last, so a crash never leaves it pointing to incomplete data
+            self._append_line(INDEX_FILE, entry)
+            self._index[key] = entry
+
+    def _read(self, file_name, location):
+        offset, length = location
+        with open(self.path / file_name, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    @staticmethod
+    def _assemble(paper, sections, texts, fields):
+        if fields is not None:
+            paper = {field: paper[field] for field in fields if field in paper}
+        if sections is not None:
+            if texts is not None:
+                sections = [dict(section, text=text) for section, text in zip(sections, texts)]
+            paper["sections"] = sections
+        return paper
+
+    def get(self, key, fields=None, sections=True, section_text=True):
+        """
+        Read a single paper.
+
+        Args:
+            key (str): Key of the paper.
+            fields (list of str): Paper-level fields to return. None returns all of them.
+            sections (bool): Whether to return the section results.
+            section_text (bool): Whether to add the raw text to the section results.
+
+        Returns:
+            dict: The paper with the selected fields.
+        """
+        entry = self._index[key]
+        paper = self._read(PAPERS_FILE, entry["papers"])
+        section_results = self._read(SECTIONS_FILE, entry["sections"]) if sections else None
+        texts = self._read(TEXTS_FILE, entry["texts"]) if sections and section_text else None
+        return self._assemble(paper, section_results, texts, fields)
+
+    def _iter_latest(self, file_name, column):
+        latest = {entry[column][0]: key for key, entry in self._index.items()}
+        offset = 0
+        if not (self.path / file_name).exists():
+            return
+        with open(self.path / file_name, "rb") as f:
+            for line in f:
+                key = latest.get(offset)
+                if key is not None:
+                    yield key, json.loads(line)
+                offset += len(line)
+
+    def iter_records(self, fields=None, sections=False, section_text=False):
+        """
+        Stream the latest version of every paper, reading each file sequentially once.
+
+        Args:
+            fields (list of str): Paper-level fields to return. None returns all of them.
+            sections (bool): Whether to return the section results.
+            section_text (bool): Whether to add the raw text to the section results.
+
+        Yields:
+            tuple: The key and the paper with the selected fields.
+        """
+        columns = []
+        if sections:
+            columns.append((SECTIONS_FILE, "sections"))
+            if section_text:
+                columns.append((TEXTS_FILE, "texts"))
+        readers = [(file_name, column, self._iter_latest(file_name, column), {}) for file_name, column in columns]
+        for key, paper in self._iter_latest(PAPERS_FILE, "papers"):
+            # The files are usually appended in the same order, but several writers or a damaged line can shift
+            # them against each other, so the records are joined by key
+            records = [self._join(key, *reader) for reader in readers]
+            section_results = records[0] if sections else None
+            texts = records[1] if sections and section_text else None
+            yield key, self._assemble(paper, section_results, texts, fields)
+
+    def _join(self, key, file_name, column, reader, pending):
+        if key in pending:
+            return pending.pop(key)
+        for other_key, record in reader:
+            if other_key == key:
+                return record
+            pending[other_key] = record
+        # Not found in the sequential pass, e.g. behind a damaged line: read it directly
+        return self._read(file_name, self._index[key][column])
+
@@ -1,7 +1,9 @@
 from pathlib import Path
 import argparse
 import arxiv
-import requests
+
+from downloader import download_papers
+import instrumentation
 
 # Mapping of human-readable sort criterion names to arxiv.SortCriterion values
 sort_criterions_arxiv = {
@@ -11,33 +13,7 @@ sort_criterions_arxiv = {
 }
 
 
-def download_paper(title, pdf_url, download_path):
-    """
-    Download and save a paper given its title, PDF URL, and download path.
-
-    Args:
-        title (str): The title of the paper.
-        pdf_url (str): The URL of the paper's PDF.
-        download_path (str): The directory where the paper should be saved.
-
-    Returns:
-        None
-    """
-    if pdf_url:
-        response = requests.get(pdf_url)
-        if response.status_code == 200:
-            # Generate a filename based on the paper's title
-            filename = f"{title.replace(' ', '_').replace(':', '_').lower()}.pdf"
-            with open(Path(download_path, filename), 'wb') as file:
-                file.write(response.content)
-            print(f"Paper downloaded as {filename}")
-        else:
-            print(f"Failed to download the paper. Status code: {response.status_code}")
-    else:
-        print(f"No PDF link found for the paper")
-
-
-def main(query_text, max_results, sort_criterion, output_path):
+def main(query_text, max_results, sort_criterion, output_path, max_workers=4):
     """
     Perform an ArXiv search based on the provided parameters and download the search results.
 
@@ -46,6 +22,7 @@ def main(query_text, max_results, sort_criterion, output_path):
         max_results (int): The maximum number of results to retrieve.
         sort_criterion (str): The sort criterion for the search results.
         output_path (str): The directory where downloaded papers should be saved.
+        max_workers (int): Number of papers downloaded at the same time.
 
     Returns:
         None
@@ -69,11 +46,9 @@ def main(query_text, max_results, sort_criterion, output_path):
         sort_order=arxiv.SortOrder.Descending
     )
 
-    # Iterate through the search results and download each paper
-    for paper in search.results():
-        title_suggested = paper.title
-        pdf_url = paper.pdf_url
-        download_paper(title_suggested, pdf_url, output_path)
+    # Download all search results concurrently
+    papers = [(paper.title, paper.pdf_url) for paper in search.results()]
+    download_papers(papers, output_path, max_workers)
 
 
 if __name__ == "__main__":
@@ -83,8 +58,16 @@ if __name__ == "__main__":
     parser.add_argument('--max_results', type=int, default=20, help="Maximum number of results to retrieve")
     parser.add_argument('--sort_criterion', type=str, default="Relevance", help="Sort criterion for results")
     parser.add_argument('--output_path', type=str, default="literature/rag", help="Output path for saving downloaded papers")
+    parser.add_argument('--max_workers', type=int, default=4, help="Number of papers downloaded at the same time")
+    parser.add_argument('--trace_path', type=str, default=None, help="JSONL file the timings and failures of all downloads are appended to; a report is printed at the end")
 
     args = parser.parse_args()
 
+    if args.trace_path:
+        instrumentation.configure(args.trace_path)
+
     # Call the main function with parsed command-line arguments
-    main(args.query_text, args.max_results, args.sort_criterion, args.output_path)
+    main(args.query_text, args.max_results, args.sort_criterion, args.output_path, args.max_workers)
+    if args.trace_path:
+        print(instrumentation.tracer.report())
+        instrumentation.tracer.close()
@@ -1,81 +1,69 @@
 from pathlib import Path
 import argparse
-import arxiv
-import requests
-from science_parse_api.api import parse_pdf
 
-
-# Function to download and save a paper given its title, PDF URL, and download path
-def download_paper(title, pdf_url, download_path):
-    """
-    Download and save a paper.
-
-    Args:
-        title (str): The title of the paper.
-        pdf_url (str): The URL of the paper's PDF.
-        download_path (str): The directory where the paper should be saved.
-
-    Returns:
-        None
-    """
-    if pdf_url:
-        if download_path is None:
-            download_path = Path(pdf_url).parent
-        else:
-            Path(download_path).mkdir(parents=True, exist_ok=True)
-        response = requests.get(pdf_url)
-        if response.status_code == 200:
-            filename = f"{title.replace(' ', '_').replace(':', '_').replace('?', '_').lower()}.pdf"
-            with open(Path(download_path, filename), 'wb') as file:
-                file.write(response.content)
-            print(f"Paper downloaded as {filename}")
-        else:
-            print(f"Failed to download the paper. Status code: {response.status_code}")
-    else:
-        print(f"No PDF link found for the paper")
+from arxiv_resolver import ArxivTitleResolver
+from downloader import download_papers
+import instrumentation
+from parse_cache import parse_pdf_cached
+from parse_pool import DEFAULT_ENDPOINTS, ParseBackendPool
 
 
 # Main function to download papers based on reference IDs and PDF path
-def main(reference_ids=None, path_to_pdf="literature/pdfs/survey.pdf", output_path=None):
+def main(reference_ids=None, path_to_pdf="literature/pdfs/survey.pdf", output_path=None, parse_cache_dir=None, max_workers=4,
+         arxiv_cache_path=None, parse_endpoints=None, parse_timeout=60):
     """
     Main function to download papers based on reference IDs and PDF path.
 
     Args:
         reference_ids (list of int): List of reference IDs of the papers to be downloaded.
         path_to_pdf (str): Path to the PDF file.
+        output_path (str): Path where the downloaded papers will be saved. Defaults to the directory of the PDF.
+        parse_cache_dir (str): Directory of the science-parse result cache. None disables the cache.
+        max_workers (int): Number of papers downloaded at the same time.
+        arxiv_cache_path (str): Path to the JSON file caching the titles resolved on arXiv. None disables the cache.
+        parse_endpoints (list of str): URLs of the science-parse servers; the PDF is parsed on the first healthy one.
+        parse_timeout (int): Timeout of a science-parse request in seconds.
 
     Returns:
         None
     """
-    host = 'http://127.0.0.1'
-    port = '8080'
+    parse_pool = ParseBackendPool(parse_endpoints, timeout=parse_timeout)
 
     pdf_file = Path(path_to_pdf)
-    output_dict = parse_pdf(host, pdf_file, port=port)
+    output_dict = parse_pdf_cached(parse_pool, pdf_file, cache_dir=parse_cache_dir)
+    if output_dict is None:
+        print(f"Failed to parse {pdf_file}")
+        return
     references = output_dict.get("references", [])
 
     # If reference_ids is not provided, download all references
     if reference_ids is None:
         reference_ids = range(1, len(references) + 1)
 
+    titles = []
     for reference_id in reference_ids:
         # Check if the reference_id is within the valid range
         if 1 <= reference_id <= len(references):
             reference = references[reference_id - 1]
-            title = reference.get("title", "")
-            search = arxiv.Search(
-                query=title,
-                max_results=1,
-                sort_by=arxiv.SortCriterion.Relevance,
-                sort_order=arxiv.SortOrder.Descending
-            )
-            for paper in search.results():
-                title_suggested = paper.title
-                pdf_url = paper.pdf_url
-                download_paper(title_suggested, pdf_url, output_path)
+            titles.append(reference.get("title") or "")
         else:
             print(f"Invalid reference ID: {reference_id}")
 
+    # Look the titles up on arXiv in batches; results that do not match the title well enough are rejected
+    matches = ArxivTitleResolver(arxiv_cache_path).resolve(titles)
+    # Different references can match the same paper, e.g. the preprint and the published version with the same
+    # title; downloading it twice at the same time would write to the same file
+    papers = {}
+    for title, match in matches.items():
+        if match is None:
+            print(f"No matching paper found on arXiv for: {title}")
+        else:
+            papers.setdefault(match["arxiv_id"], (match["title"], match["pdf_url"]))
+
+    if output_path is None:
+        output_path = pdf_file.parent
+    download_papers(list(papers.values()), output_path, max_workers)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -85,6 +73,20 @@ if __name__ == "__main__":
     parser.add_argument('--path_to_pdf', type=str, default="literature/rag/a_survey_on_retrieval-augmented_text_generation.pdf",
                         help="Path to the paper as PDF file")
     parser.add_argument('--output_path', type=str, default=None, help="Output path for saving downloaded papers. If no path given, the papers will be saved in the same directory as the origibnal paper")
+    parser.add_argument('--max_workers', type=int, default=4, help="Number of papers downloaded at the same time")
+    parser.add_argument('--arxiv_cache_path', type=str, default="arxiv_titles.json", help="JSON file caching the titles resolved on arXiv. Pass an empty string to disable the cache")
+    parser.add_argument('--parse_cache_dir', type=str, default="parse_cache", help="Directory where the science-parse results are cached. Pass an empty string to disable the cache")
+    parser.add_argument('--parse_endpoints', type=str, nargs='+', default=DEFAULT_ENDPOINTS, help="URLs of the science-parse servers; if one is down, the next healthy one is used")
+    parser.add_argument('--parse_timeout', type=int, default=60, help="Timeout of a science-parse request in seconds")
+    parser.add_argument('--trace_path', type=str, default=None, help="JSONL file the timings and failures of all downloads are appended to; a report is printed at the end")
 
     args = parser.parse_args()
-    main(reference_ids=args.reference_ids, path_to_pdf=args.path_to_pdf, output_path=args.output_path)
+    if args.trace_path:
+        instrumentation.configure(args.trace_path)
+    main(reference_ids=args.reference_ids, path_to_pdf=args.path_to_pdf, output_path=args.output_path,
+         parse_cache_dir=args.parse_cache_dir or None, max_workers=args.max_workers,
+         arxiv_cache_path=args.arxiv_cache_path or None, parse_endpoints=args.parse_endpoints,
+         parse_timeout=args.parse_timeout)
+    if args.trace_path:
+        print(instrumentation.tracer.report())
+        instrumentation.tracer.close()
@@ -0,0 +1,150 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def paper_filename(title):
+    """
+    Generate a filename based on the paper's title.
+
+    Args:
+        title (str): The title of the paper.
+
+    Returns:
+        str: The filename of the PDF.
+    """
+    return f"{title.replace(' ', '_').replace(':', '_').replace('?', '_').replace('/', '_').lower()}.pdf"
+
+
+def create_session(pool_size=8, retries=3):
+    """
+    Create a requests session with a connection pool and retries on transient errors.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host.
+        retries (int): Number of retries on connection errors and 429 / 5xx responses.
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def is_valid_pdf(path):
+    """
+    Check whether a file looks like a complete PDF.
+
+    Args:
+        path (Path): Path to the file.
+
+    Returns:
+        bool: True if the file exists, starts with the PDF header and has an end-of-file marker at its end.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(5)
+            f.seek(max(0, os.path.getsize(path) - 1024))
+            tail = f.read()
+    except OSError:
+        return False
+    return header == b"%PDF-" and b"%%EOF" in tail
+
+
+def download_paper(title, pdf_url, download_path, session=None, timeout=60):
+    """
+    Download and save a paper given its title, PDF URL, and download path.
+
+    The PDF is streamed to a temporary ".part" file that is renamed once the download is complete, so an
+    interrupted download never leaves a broken PDF behind. A ".part" file from an interrupted download is resumed
+    with a range request, and papers that were already downloaded are skipped.
+
+    Args:
+        title (str): The title of the paper.
+        pdf_url (str): The URL of the paper's PDF.
+        download_path (str): The directory where the paper should be saved.
+        session (requests.Session): Session to reuse connections. A new one is created if not given.
+        timeout (int): Timeout of the request in seconds.
+
+    Returns:
+        Path: Path to the downloaded paper or None if the download failed.
+    """
+    with instrumentation.span("download", title=title) as span:
+        if not pdf_url:
+            print("No PDF link found for the paper")
+            span.update(status="error", reason="No PDF link")
+            return None
+
+        Path(download_path).mkdir(parents=True, exist_ok=True)
+        filename = paper_filename(title)
+        file_path = Path(download_path, filename)
+        if is_valid_pdf(file_path):
+            print(f"Paper already downloaded as {filename}")
+            span.update(status="skipped", reason="Already downloaded")
+            return file_path
+
+        session = session or create_session()
+        part_path = Path(f"{file_path}.part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        span.update(resumed_bytes=offset, bytes=0)
+
+        try:
+            with session.get(pdf_url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # The partial file already holds the whole PDF
+                    pass
+                elif response.status_code in (200, 206):
+                    mode = "ab" if response.status_code == 206 else "wb"
+                    with open(part_path, mode) as file:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            file.write(chunk)
+                            span["bytes"] += len(chunk)
+                else:
+                    print(f"Failed to download the paper. Status code: {response.status_code}")
+                    span.update(status="error", reason=f"HTTP {response.status_code}")
+                    return None
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to download the paper {title}: {e}")
+            span.update(status="error", reason=type(e).__name__)
+            return None
+
+        if not is_valid_pdf(part_path):
+            print(f"Downloaded file for {title} is not a PDF")
+            part_path.unlink(missing_ok=True)
+            span.update(status="error", reason="Not a PDF")
+            return None
+
+        os.replace(part_path, file_path)
+        print(f"Paper downloaded as {filename}")
+        return file_path
+
+
+def download_papers(papers, download_path, max_workers=4):
+    """
+    Download several papers concurrently over a shared connection pool.
+
+    Args:
+        papers (list): Tuples of the title and the PDF URL of each paper.
+        download_path (str): The directory where the papers should be saved.
+        max_workers (int): Number of papers downloaded at the same time.
+
+    Returns:
+        list: Path to each downloaded paper or None if its download failed, in the order of papers.
+    """
+    max_workers = max(1, max_workers)
+    session = create_session(pool_size=max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda paper: download_paper(paper[0], paper[1], download_path, session), papers))
@@ -2,6 +2,39 @@ import json
 import os
 import argparse
 
+from corpus_store import CorpusStore
+
+
+def print_paper(data, name):
+    """
+    Print the summaries, metrics and mitigation techniques of a parsed paper.
+
+    Args:
+        data (dict): The parsed paper.
+        name (str): Name printed if the paper has no title.
+
+    Returns:
+        None
+    """
+    try:
+        print(data["title"])
+    except KeyError:
+        print(name)
+    print(data["overall_summary"])
+    print(data["contributions"])
+    print(data["further_research"])
+    print(data["metrics_aggregated"])
+    print(data["mitigations_aggregated"])
+
+    for section in data["sections"]:
+        if section["metrics"]:
+            print("Metrics: ", section["metrics"])
+            print(section["metrics_description"])
+        if section["mitigation"]:
+            print("Mitigation:", section["mitigation"])
+            print(section["mitigation_description"])
+    print("-" * 100)
+
 
 def process_parsed_papers(dir_path):
     """
@@ -13,36 +46,38 @@ def process_parsed_papers(dir_path):
     Returns:
         None
     """
-    all_files = os.listdir(dir_path)
+    all_files = [file for file in os.listdir(dir_path) if file.endswith(".json")]
 
     for file in all_files:
         file_path = os.path.join(dir_path, file)
         with open(file_path, "r", encoding="utf-8") as f:
             data = json.load(f)
+        print_paper(data, file)
+
+
+def process_corpus(corpus_path):
+    """
+    Stream the papers of a corpus store and print their contents.
+
+    Only the paper-level fields and the section results are read, the raw section texts are never loaded.
 
-        try:
-            print(data["title"])
-        except KeyError:
-            print(file)
-        print(data["overall_summary"])
-        print(data["contributions"])
-        print(data["further_research"])
-        print(data["metrics_aggregated"])
-        print(data["mitigations_aggregated"])
-
-        for section in data["sections"]:
-            if section["metrics"]:
-                print("Metrics: ", section["metrics"])
-                print(section["metrics_description"])
-            if section["mitigation"]:
-                print("Mitigation:", section["mitigation"])
-                print(section["mitigation_description"])
-        print("-" * 100)
+    Args:
+        corpus_path (str): The directory of the corpus store written by main.py.
+
+    Returns:
+        None
+    """
+    for key, data in CorpusStore(corpus_path).iter_records(sections=True, section_text=False):
+        print_paper(data, key)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process parsed papers in a specified directory and print their contents.")
     parser.add_argument('--dir_path', type=str, default="parsed_papers", help="Path to the directory where parsed papers are stored")
+    parser.add_argument('--corpus_path', type=str, default=None, help="Path to a corpus store written by main.py. If given, it is read instead of dir_path")
 
     args = parser.parse_args()
-    process_parsed_papers(args.dir_path)
\ No newline at end of file
+    if args.corpus_path:
+        process_corpus(args.corpus_path)
+    else:
+        process_parsed_papers(args.dir_path)
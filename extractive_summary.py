@@ -0,0 +1,61 @@
+import re
+from collections import Counter
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers him
+his how i if in into is it its itself just may me more most my no nor not of off on once only or other our ours out
+over own same she should so some such than that the their theirs them then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you your we us et al
+""".split())
+
+
+def split_sentences(text):
+    """
+    Split a text into sentences at sentence-ending punctuation.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list of str: The non-empty sentences.
+    """
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+
+def content_words(text):
+    """
+    Return the lower-cased words of a text without stopwords.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list of str: The content words.
+    """
+    return [word for word in re.findall(r"[a-z][a-z0-9-]+", text.lower()) if word not in STOPWORDS]
+
+
+def extractive_summary(text, max_sentences=3):
+    """
+    Summarize a text locally by picking the sentences with the most frequent content words.
+
+    The sentences are scored by the average frequency of their content words in the whole text and the best ones
+    are returned in their original order. No LLM call is needed, so the summary can be used as cheap context.
+
+    Args:
+        text (str): The text to summarize.
+        max_sentences (int): Maximum number of sentences in the summary.
+
+    Returns:
+        str: The summary.
+    """
+    sentences = split_sentences(text)
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+
+    sentence_words = [content_words(sentence) for sentence in sentences]
+    frequencies = Counter(word for words in sentence_words for word in words)
+    scores = [sum(frequencies[word] for word in words) / len(words) if words else 0 for words in sentence_words]
+    best = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)[:max_sentences]
+    return " ".join(sentences[i] for i in sorted(best))
@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+
+# Columns of the full-text index, the weights rank matches in titles higher than matches in the other fields
+FIELDS = ["title", "summary", "metrics", "mitigation"]
+FIELD_WEIGHTS = [5.0, 1.0, 2.0, 2.0]
+
+
+def _text(value):
+    if not value:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def paper_fields(data, file):
+    """
+    Extract the indexed fields of a parsed paper.
+
+    Args:
+        data (dict): The parsed paper as written by main.py.
+        file (str): Name of the JSON file, used as title if the paper has none.
+
+    Returns:
+        dict: The text of each field in FIELDS.
+    """
+    sections = data.get("sections", [])
+
+    def join(paper_keys, section_keys):
+        texts = [_text(data.get(key)) for key in paper_keys]
+        texts += [_text(section.get(key)) for section in sections for key in section_keys]
+        return "\n".join(text for text in texts if text)
+
+    return {
+        "title": _text(data.get("title")) or file,
+        "summary": join(["overall_summary", "contributions", "further_research"], ["summary"]),
+        "metrics": join(["metrics_aggregated"], ["metrics", "metrics_description"]),
+        "mitigation": join(["mitigations_aggregated"], ["mitigation", "mitigation_description"]),
+    }
+
+
+def open_index(index_path):
+    """
+    Open the index database and create its tables if they don't exist.
+
+    Args:
+        index_path (str): Path to the SQLite file of the index.
+
+    Returns:
+        sqlite3.Connection: The connection to the index.
+    """
+    connection = sqlite3.connect(index_path)
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, mtime REAL, size INTEGER)")
+        connection.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS papers USING fts5(file UNINDEXED, {', '.join(FIELDS)})")
+    return connection
+
+
+def update_index(connection, dir_path):
+    """
+    Bring the index up to date with the parsed papers in a directory.
+
+    Only files that are new or changed since the last update (by modification time and size) are read, and files
+    that were removed are dropped from the index.
+
+    Args:
+        connection (sqlite3.Connection): The connection to the index.
+        dir_path (str): The directory path where parsed papers are stored.
+
+    Returns:
+        tuple: Number of indexed and removed files.
+    """
+    indexed = {file: (mtime, size) for file, mtime, size in connection.execute("SELECT file, mtime, size FROM files")}
+    current = {}
+    for entry in os.scandir(dir_path):
+        if entry.is_file() and entry.name.endswith(".json"):
+            stat = entry.stat()
+            current[entry.name] = (stat.st_mtime, stat.st_size)
+
+    changed = [file for file, signature in current.items() if indexed.get(file) != signature]
+    removed = [file for file in indexed if file not in current]
+
+    with connection:
+        for file in removed:
+            connection.execute("DELETE FROM papers WHERE file = ?", (file,))
+            connection.execute("DELETE FROM files WHERE file = ?", (file,))
+        for file in changed:
+            try:
+                with open(os.path.join(dir_path, file), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {file}: {e}")
+                continue
+            fields = paper_fields(data, file)
+            connection.execute("DELETE FROM papers WHERE file = ?", (file,))
+            connection.execute(f"INSERT INTO papers (file, {', '.join(FIELDS)}) VALUES (?{', ?' * len(FIELDS)})",
+                               [file] + [fields[field] for field in FIELDS])
+            connection.execute("INSERT OR REPLACE INTO files (file, mtime, size) VALUES (?, ?, ?)",
+                               (file, *current[file]))
+    return len(changed), len(removed)
+
+
+def build_match_expression(query_text, fields=None):
+    """
+    Turn free text into an FTS5 match expression that requires all words, optionally in the given fields only.
+
+    Args:
+        query_text (str): The words to search for.
+        fields (list of str): The fields to search in. None searches all fields.
+
+    Returns:
+        str: The match expression.
+    """
+    terms = " ".join(f'"{word}"' for word in re.findall(r"\w+", query_text))
+    if fields:
+        return f"{{{' '.join(fields)}}} : ({terms})"
+    return terms
+
+
+def query_index(connection, query_text, fields=None, limit=10):
+    """
+    Search the index and return the best matching papers.
+
+    Args:
+        connection (sqlite3.Connection): The connection to the index.
+        query_text (str): The words to search for.
+        fields (list of str): The fields to search in. None searches all fields.
+        limit (int): Maximum number of hits.
+
+    Returns:
+        list of tuple: File, title, score and snippet of each hit, the best hit first.
+    """
+    if not re.search(r"\w", query_text):
+        return []
+    weights = ", ".join(["0"] + [str(weight) for weight in FIELD_WEIGHTS])
+    return connection.execute(
+        f"SELECT file, title, bm25(papers, {weights}) AS score, snippet(papers, -1, '[', ']', '...', 16) "
+        f"FROM papers WHERE papers MATCH ? ORDER BY score LIMIT ?",
+        (build_match_expression(query_text, fields), limit)
+    ).fetchall()
+
+
+def main(dir_path, index_path, query_text=None, fields=None, limit=10, update=True):
+    """
+    Update the index over the parsed papers and print the hits of a query.
+
+    Args:
+        dir_path (str): The directory path where parsed papers are stored.
+        index_path (str): Path to the SQLite file of the index.
+        query_text (str): The words to search for. None only updates the index.
+        fields (list of str): The fields to search in. None searches all fields.
+        limit (int): Maximum number of hits.
+        update (bool): Whether to update the index before querying.
+
+    Returns:
+        None
+    """
+    connection = open_index(index_path)
+    if update:
+        indexed, removed = update_index(connection, dir_path)
+        print(f"Indexed {indexed} and removed {removed} papers")
+    if query_text:
+        start = time.perf_counter()
+        hits = query_index(connection, query_text, fields, limit)
+        print(f"{len(hits)} hits in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for file, title, score, snippet in hits:
+            print(f"{-score:.2f}  {title}  ({file})")
+            print(f"      {snippet}")
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the parsed papers and search them.")
+    parser.add_argument('--dir_path', type=str, default="parsed_papers", help="Path to the directory where parsed papers are stored")
+    parser.add_argument('--index_path', type=str, default="parsed_papers_index.db", help="SQLite file of the index")
+    parser.add_argument('--query', type=str, default=None, help="Words to search for. If not given, the index is only updated")
+    parser.add_argument('--fields', nargs='+', choices=FIELDS, default=None, help="Fields to search in. By default all fields are searched")
+    parser.add_argument('--limit', type=int, default=10, help="Maximum number of hits")
+    parser.add_argument('--no_update', action='store_true', help="Query the index without updating it first")
+
+    args = parser.parse_args()
+    main(args.dir_path, args.index_path, args.query, args.fields, args.limit, not args.no_update)
@@ -0,0 +1,347 @@
+import argparse
+import contextvars
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from section_planner import count_tokens
+
+# USD per 1000 prompt and completion tokens, matched by the longest prefix of the model name
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+}
+PERCENTILES = [50, 90, 95, 99]
+
+
+def estimate_cost(model_name, prompt_tokens, completion_tokens):
+    """
+    Estimate the cost of an LLM call from its token counts.
+
+    Args:
+        model_name (str): Name of the OpenAI model.
+        prompt_tokens (int): Number of prompt tokens.
+        completion_tokens (int): Number of completion tokens.
+
+    Returns:
+        float: The estimated cost in USD, None if the price of the model is unknown.
+    """
+    prefixes = [prefix for prefix in MODEL_PRICES if (model_name or "").startswith(prefix)]
+    if not prefixes:
+        return None
+    prompt_price, completion_price = MODEL_PRICES[max(prefixes, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def percentile(values, q):
+    """
+    Compute a percentile with linear interpolation between the closest ranks.
+
+    Args:
+        values (list of float): The sorted values.
+        q (float): The percentile between 0 and 100.
+
+    Returns:
+        float: The percentile, None if there are no values.
+    """
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Tracer:
+    """
+    Record timed spans of the pipeline stages and write them as JSONL trace.
+
+    A span is a dict with the stage, its wall time, a status ("ok", "skipped" or "error"), the failure reason and
+    any fields the instrumented code adds, e.g. token counts. Spans are recorded when they end, so nested spans
+    appear before their parent. The stack of open spans is a context variable: every thread has its own, and
+    functions run in worker threads through propagate() start from the stack of the submitting thread.
+    annotate() adds fields to the innermost open span, and a span inherits the paper of its parent, also across
+    threads.
+    """
+
+    def __init__(self, trace_path=None, enabled=True):
+        """
+        Args:
+            trace_path (str): Path to the JSONL file the spans are appended to. None keeps them in memory only.
+            enabled (bool): Whether spans are recorded at all.
+        """
+        self.enabled = enabled
+        self.records = []
+        self._lock = threading.Lock()
+        self._stack = contextvars.ContextVar(f"span_stack_{id(self)}", default=())
+        self._file = open(trace_path, "a", encoding="utf-8") if enabled and trace_path else None
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """
+        Time a block of code as one span.
+
+        Args:
+            stage (str): Name of the pipeline stage, e.g. "process_section".
+            **fields: Fields stored with the span, e.g. the paper.
+
+        Yields:
+            dict: The span, so the block can add fields or set "status" and "reason".
+        """
+        span = {"stage": stage, **fields}
+        if not self.enabled:
+            yield span
+            return
+        stack = self._stack.get()
+        if stack and "paper" in stack[-1]:
+            span.setdefault("paper", stack[-1]["paper"])
+        token = self._stack.set(stack + (span,))
+        span["start"] = time.time()
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["status"] = "error"
+            span["reason"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["wall_time"] = time.perf_counter() - start
+            span.setdefault("status", "ok")
+            self._stack.reset(token)
+            self.record(span)
+
+    def annotate(self, **fields):
+        """Add fields to the innermost open span of the current thread, if there is one."""
+        if self.enabled:
+            stack = self._stack.get()
+            if stack:
+                stack[-1].update(fields)
+
+    def increment(self, field, amount=1):
+        """Add amount to a numeric field of the innermost open span of the current thread."""
+        if self.enabled:
+            stack = self._stack.get()
+            if stack:
+                stack[-1][field] = stack[-1].get(field, 0) + amount
+
+    def record(self, span):
+        """Store a finished span and append it to the trace file."""
+        if "prompt_tokens" in span and "cost" not in span:
+            span["cost"] = 0.0 if span.get("cache_hit") else estimate_cost(
+                span.get("model"), span["prompt_tokens"], span.get("completion_tokens", 0))
+        with self._lock:
+            self.records.append(span)
+            if self._file is not None:
+                self._file.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+                self._file.flush()
+
+    def close(self):
+        """Close the trace file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def summary(self):
+        """Aggregate the recorded spans per stage, see summarize_records."""
+        return summarize_records(self.records)
+
+    def report(self):
+        """Format the summary of the recorded spans as a plain text table, see format_report."""
+        return format_report(self.summary())
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    Add the token counts and retries of LLM calls to the innermost open span of the calling thread.
+
+    The counts reported by the API are used if there are any. Otherwise, e.g. for cached responses or fake
+    models, they are estimated from the prompt and the response text and the span is marked with
+    "tokens_estimated".
+    """
+
+    def __init__(self, tracer, model_name="gpt-3.5-turbo"):
+        self.tracer = tracer
+        self.model_name = model_name
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.tracer.increment("prompt_tokens", sum(count_tokens(prompt, self.model_name) for prompt in prompts))
+        self.tracer.annotate(tokens_estimated=True)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        prompts = ["\n".join(str(message.content) for message in message_list) for message_list in messages]
+        self.on_llm_start(serialized, prompts, **kwargs)
+
+    def on_llm_end(self, response, **kwargs):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if token_usage:
+            self.tracer.annotate(prompt_tokens=token_usage.get("prompt_tokens", 0),
+                                 completion_tokens=token_usage.get("completion_tokens", 0),
+                                 tokens_estimated=False)
+        else:
+            texts = [generation.text for generations in response.generations for generation in generations]
+            self.tracer.increment("completion_tokens",
+                                  sum(count_tokens(text, self.model_name) for text in texts))
+
+    def on_retry(self, retry_state, **kwargs):
+        self.tracer.increment("retries")
+
+
+def summarize_records(records):
+    """
+    Aggregate spans per stage; LLM calls are grouped per chain as well.
+
+    Args:
+        records (list of dict): The spans, e.g. Tracer.records or the lines of a trace file.
+
+    Returns:
+        dict: Per stage the number of spans, the statuses, the total and percentile wall times, the time spent
+            waiting for an LLM call slot, the tokens, the estimated cost, the retries, the cache hits and the most
+            common failure reasons.
+    """
+    groups = defaultdict(list)
+    for record in records:
+        name = record["stage"] if not record.get("chain") else f"{record['stage']}[{record['chain']}]"
+        groups[name].append(record)
+
+    summary = {}
+    for name, group in sorted(groups.items()):
+        wall_times = sorted(record["wall_time"] for record in group)
+        statuses = Counter(record.get("status", "ok") for record in group)
+        reasons = Counter(record["reason"] for record in group if record.get("reason"))
+        stage = {
+            "count": len(group),
+            "ok": statuses["ok"],
+            "skipped": statuses["skipped"],
+            "errors": statuses["error"],
+            "wall_time_total": sum(wall_times),
+            **{f"p{q}": percentile(wall_times, q) for q in PERCENTILES},
+            "max": wall_times[-1],
+            "retries": sum(record.get("retries", 0) for record in group),
+            "queue_time_total": sum(record.get("queue_time", 0.0) for record in group),
+            "reasons": dict(reasons.most_common(5)),
+        }
+        if any("prompt_tokens" in record for record in group):
+            stage.update({
+                "prompt_tokens": sum(record.get("prompt_tokens", 0) for record in group),
+                "completion_tokens": sum(record.get("completion_tokens", 0) for record in group),
+                "cost": sum(record.get("cost") or 0.0 for record in group),
+                "cache_hits": sum(1 for record in group if record.get("cache_hit")),
+            })
+        summary[name] = stage
+    return summary
+
+
+def format_report(summary):
+    """
+    Format a summary as a plain text table.
+
+    Args:
+        summary (dict): The summary as returned by summarize_records.
+
+    Returns:
+        str: The report.
+    """
+    columns = ["count", "errors", "skipped", "retries", "wall_time_total", "queue_time_total"] + [f"p{q}" for q in PERCENTILES] + \
+              ["max", "prompt_tokens", "completion_tokens", "cost", "cache_hits"]
+    width = max([len("stage")] + [len(name) for name in summary])
+    lines = ["stage".ljust(width) + "".join(column.rjust(max(len(column), 8) + 2) for column in columns)]
+    for name, stage in summary.items():
+        cells = []
+        for column in columns:
+            value = stage.get(column)
+            if value is None:
+                text = "-"
+            elif column == "cost":
+                text = f"{value:.4f}"
+            elif isinstance(value, float):
+                text = f"{value:.2f}"
+            else:
+                text = str(value)
+            cells.append(text.rjust(max(len(column), 8) + 2))
+        lines.append(name.ljust(width) + "".join(cells))
+    for name, stage in summary.items():
+        for reason, count in stage["reasons"].items():
+            lines.append(f"{name}: {count} x {reason}")
+    return "\n".join(lines)
+
+
+def read_trace(trace_path):
+    """
+    Read the spans of a trace file.
+
+    Args:
+        trace_path (str): Path to the JSONL trace.
+
+    Returns:
+        list of dict: The spans.
+    """
+    with open(trace_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# The tracer of the running process; disabled until configure() is called
+tracer = Tracer(enabled=False)
+
+
+def configure(trace_path=None):
+    """
+    Enable tracing for the running process.
+
+    Args:
+        trace_path (str): Path to the JSONL file the spans are appended to. None keeps them in memory only.
+
+    Returns:
+        Tracer: The new tracer.
+    """
+    global tracer
+    tracer.close()
+    tracer = Tracer(trace_path)
+    return tracer
+
+
+def span(stage, **fields):
+    """Time a block of code as one span of the current tracer, see Tracer.span."""
+    return tracer.span(stage, **fields)
+
+
+def annotate(**fields):
+    """Add fields to the innermost open span of the current thread, see Tracer.annotate."""
+    tracer.annotate(**fields)
+
+
+def propagate(function):
+    """
+    Wrap a function so it runs with the open spans of the calling thread, e.g. when submitted to a thread pool.
+
+    Spans opened by the function are nested in the innermost open span of the caller and inherit its paper.
+
+    Args:
+        function (callable): The function.
+
+    Returns:
+        callable: The wrapped function, which may be called from several threads at the same time.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so every call gets its own copy
+        return context.copy().run(function, *args, **kwargs)
+
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the timing report of a pipeline trace.")
+    parser.add_argument('--trace_path', type=str, default="trace.jsonl", help="JSONL trace written with --trace_path")
+    parser.add_argument('--json', action='store_true', help="Print the summary as JSON instead of a table")
+
+    args = parser.parse_args()
+    trace_summary = summarize_records(read_trace(args.trace_path))
+    print(json.dumps(trace_summary, indent=4) if args.json else format_report(trace_summary))
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from langchain.load.dump import dumps
+from langchain.load.load import loads
+from langchain.schema.cache import BaseCache
+
+import instrumentation
+from models_and_prompts import TEMPLATE_VERSION
+
+
+class LRUSQLiteCache(BaseCache):
+    """
+    Persistent LLM cache stored in a SQLite file with size-based LRU eviction.
+
+    The entries are keyed by the llm string (model name, temperature, ...), the rendered prompt and the
+    template version, so re-running the pipeline with unchanged prompts returns the stored responses
+    instead of calling the API again. Set it with `langchain.llm_cache = LRUSQLiteCache(...)` and it is
+    used by every LLMChain built in `main.initialize_chain`.
+    """
+
+    def __init__(self, database_path="llm_cache.db", max_size_mb=512, template_version=TEMPLATE_VERSION):
+        """
+        Args:
+            database_path (str): Path to the SQLite file. It is created if it doesn't exist.
+            max_size_mb (float): Maximum size of the stored responses in megabytes. None means no limit.
+            template_version (str): Version of the templates, part of every key.
+        """
+        self.max_size_bytes = None if max_size_mb is None else int(max_size_mb * 1024 * 1024)
+        self.template_version = template_version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        # Running total of the stored bytes, so an update does not scan the whole table. It only counts the
+        # writes of this instance, processes sharing the file each evict against their own view of the size.
+        self._total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _key(self, prompt, llm_string):
+        content = "\n".join([self.template_version, llm_string, prompt])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        """Look up the generations stored for the prompt and llm string, None if there are none."""
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            instrumentation.annotate(cache_hit=True)
+            with self._connection:
+                self._connection.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt, llm_string, return_val):
+        """Store the generations for the prompt and llm string and evict the least recently used entries."""
+        key = self._key(prompt, llm_string)
+        response = json.dumps([dumps(generation) for generation in return_val])
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, len(response), time.time())
+            )
+            self._total_size += len(response) - (row[0] if row is not None else 0)
+            self._evict()
+
+    def _evict(self):
+        if self.max_size_bytes is None or self._total_size <= self.max_size_bytes:
+            return
+        # The cursor walks the last_access index from the oldest entry and stops as soon as enough is freed
+        evicted = []
+        for key, size in self._connection.execute("SELECT key, size FROM llm_cache ORDER BY last_access"):
+            if self._total_size <= self.max_size_bytes:
+                break
+            evicted.append((key,))
+            self._total_size -= size
+        self._connection.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+
+    def clear(self, **kwargs):
+        """Remove all entries and reset the counters."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM llm_cache")
+            self._total_size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return the hit / miss counters and the current size of the cache.
+
+        Returns:
+            dict: Number of hits, misses, stored entries and stored bytes.
+        """
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            size = self._total_size
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": size}
@@ -0,0 +1,262 @@
+import random
+import threading
+import time
+
+import openai
+from langchain.callbacks.base import BaseCallbackHandler
+
+import instrumentation
+
+# Seconds worth of requests or tokens that may be sent at once; the API enforces its per-minute limits on shorter
+# intervals, so a full minute of budget must not be spent in one burst
+BURST_SECONDS = 10
+
+# Errors after which the same request is sent again
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at a rate given per minute.
+
+    The bucket starts full and holds the tokens of burst_seconds. Requests larger than the capacity are admitted
+    once the bucket is full, so they cannot block forever.
+    """
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS, clock=time.monotonic):
+        """
+        Args:
+            per_minute (float): Tokens added per minute.
+            burst_seconds (float): The capacity of the bucket in seconds of refill.
+            clock (callable): Function returning the current time in seconds.
+        """
+        self.rate = float(per_minute) / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.clock = clock
+        self.tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        """
+        Take tokens from the bucket, the balance may become negative.
+
+        Args:
+            amount (float): Number of tokens.
+
+        Returns:
+            float: Seconds to wait before the tokens are actually available.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def try_take(self, amount):
+        """
+        Take tokens from the bucket only if they are available.
+
+        Args:
+            amount (float): Number of tokens.
+
+        Returns:
+            bool: Whether the tokens were taken.
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens < min(amount, self.capacity):
+                return False
+            self.tokens -= min(amount, self.capacity)
+            return True
+
+    def refund(self, amount):
+        """Give back tokens that were reserved but not used, or take more if amount is negative."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """Remember the total tokens the API reported for the last LLM call, None if it reported none."""
+
+    def __init__(self):
+        self.total_tokens = None
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.total_tokens = None
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.total_tokens = None
+
+    def on_llm_end(self, response, **kwargs):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        self.total_tokens = token_usage.get("total_tokens")
+
+
+class LLMScheduler:
+    """
+    Central gate for all LLM calls: request and token rate limits, retries with backoff and adaptive concurrency.
+
+    Before a call is sent, one request is taken from the requests-per-minute bucket and the estimated prompt and
+    completion tokens from the tokens-per-minute bucket; the call waits until both are available. Calls failing
+    with a retryable error (rate limit, timeout, server error) are sent again after a jittered exponential backoff,
+    or after the delay the API asks for. The number of calls in flight is limited adaptively: it is halved on every
+    rate-limit error and grows by one after as many successful calls as the current limit (additive increase,
+    multiplicative decrease), so the pipeline settles right below the rate the account allows.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=None, min_concurrency=1,
+                 max_retries=6, base_delay=1.0, max_delay=60.0, completion_tokens=512, sleep=time.sleep):
+        """
+        Args:
+            requests_per_minute (float): Requests per minute allowed for the account. None means no limit.
+            tokens_per_minute (float): Tokens per minute allowed for the account. None means no limit.
+            max_concurrency (int): Maximum number of calls in flight. None means no limit until the first
+                rate-limit error.
+            min_concurrency (int): The adaptive limit never goes below this number of calls in flight.
+            max_retries (int): Number of times a call is sent again after a retryable error.
+            base_delay (float): Backoff in seconds before the first retry; it doubles with every retry.
+            max_delay (float): Maximum backoff in seconds.
+            completion_tokens (int): Tokens reserved for the answer of every call until its usage is known.
+            sleep (callable): Function sleeping for the given seconds, e.g. a stub for tests.
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min_concurrency)
+        self.concurrency_limit = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.completion_tokens = completion_tokens
+        self.sleep = sleep
+        self.in_flight = 0
+        self.retries = 0
+        self.rate_limit_errors = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def _acquire_slot(self):
+        with self._condition:
+            while self.concurrency_limit is not None and self.in_flight >= self.concurrency_limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def _release_slot(self, rate_limited):
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.rate_limit_errors += 1
+                self._successes = 0
+                current = self.concurrency_limit or self.in_flight + 1
+                self.concurrency_limit = max(self.min_concurrency, current // 2)
+            elif self.concurrency_limit is not None:
+                self._successes += 1
+                below_max = self.max_concurrency is None or self.concurrency_limit < self.max_concurrency
+                if self._successes >= self.concurrency_limit and below_max:
+                    self.concurrency_limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def _wait_for_budget(self, tokens):
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def _settle(self, reserved, used):
+        if used is None:
+            # No usage reported, e.g. the response came from the LLM cache: the API was not called
+            if self.request_bucket is not None:
+                self.request_bucket.refund(1)
+            used = 0
+        if self.token_bucket is not None:
+            self.token_bucket.refund(reserved - used)
+
+    def backoff(self, attempt, error=None):
+        """
+        Compute the delay before a retry.
+
+        Args:
+            attempt (int): Number of the failed attempt, starting at 0.
+            error (Exception): The error of the failed attempt. Its Retry-After header is respected.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        headers = getattr(error, "headers", None) or {}
+        try:
+            retry_after = float(headers.get("retry-after", 0))
+        except (TypeError, ValueError):
+            retry_after = 0.0
+        # Full jitter: retries of calls that failed at the same time are spread over the whole window
+        return max(retry_after, random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def call(self, function, prompt_tokens=0, token_usage=None):
+        """
+        Run an LLM call within the rate limits, retrying it on retryable errors.
+
+        Args:
+            function (callable): Function without arguments sending the request and returning the response.
+            prompt_tokens (int): Estimated number of prompt tokens of the request.
+            token_usage (callable): Function without arguments returning the tokens actually used by the last
+                attempt, e.g. TokenUsageCallbackHandler.total_tokens. The reserved tokens are corrected with it; if
+                it returns None, the call is assumed to be answered from the cache and its budget is given back.
+
+        Returns:
+            The return value of function.
+        """
+        reserved = prompt_tokens + self.completion_tokens
+        for attempt in range(self.max_retries + 1):
+            waited = time.perf_counter()
+            self._wait_for_budget(reserved)
+            self._acquire_slot()
+            instrumentation.tracer.increment("queue_time", time.perf_counter() - waited)
+            rate_limited = False
+            try:
+                response = function()
+            except RETRYABLE_ERRORS as e:
+                rate_limited = isinstance(e, openai.error.RateLimitError)
+                if attempt == self.max_retries:
+                    raise
+                error = e
+            else:
+                self._settle(reserved, token_usage() if token_usage is not None else None)
+                return response
+            finally:
+                self._release_slot(rate_limited)
+
+            self.retries += 1
+            instrumentation.tracer.increment("retries")
+            delay = self.backoff(attempt, error)
+            print(f"{type(error).__name__}: {error}. Retrying in {delay:.1f} s "
+                  f"(attempt {attempt + 2} of {self.max_retries + 1})")
+            self.sleep(delay)
+
+    def stats(self):
+        """
+        Return the counters of the scheduler.
+
+        Returns:
+            dict: Number of retries and rate-limit errors and the current concurrency limit.
+        """
+        with self._condition:
+            return {"retries": self.retries, "rate_limit_errors": self.rate_limit_errors,
+                    "concurrency_limit": self.concurrency_limit}
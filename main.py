@@ -1,6 +1,8 @@
 import argparse
 import json
 import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import langchain
@@ -10,10 +12,6 @@ from langchain import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.chat_models import ChatOpenAI
 from langchain.output_parsers import StructuredOutputParser
-from science_parse_api.api import parse_pdf
-
-# debug langchain
-langchain.debug = True
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -25,16 +23,72 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 if openai_api_key is None:
     raise ValueError("OpenAI API key is not provided in the environment variable OPENAI_API_KEY")
 
+from aggregation import tree_reduce
+from checkpoints import checkpoint_path, file_sha256, load_checkpoint, save_checkpoint, settings_hash
+from corpus_store import CorpusStore
+from extractive_summary import extractive_summary
+import instrumentation
+from instrumentation import UsageCallbackHandler
+from llm_cache import LRUSQLiteCache
+from llm_scheduler import LLMScheduler, TokenUsageCallbackHandler
 from models_and_prompts import SETTINGS
+from parse_cache import parse_pdf_cached
+from parse_pool import DEFAULT_ENDPOINTS, ParseBackendPool
+from pdf_watcher import PDFWatcher
+from section_planner import (COMPLETION_TOKENS, PREV_SUMMARY_TOKENS, combine_chunk_outputs, count_tokens,
+                             plan_sections, truncate_to_tokens)
+from section_triage import DECISIONS, triage_sections
+
+# Central gate of all LLM calls enforcing the rate limits, see llm_scheduler.LLMScheduler; None calls directly
+llm_scheduler = None
+
+# How the sections of a paper are scheduled, see process_paper
+SECTION_MODES = ["sequential", "parallel", "refine"]
+# Maximum number of units of one paper summarized at the same time in the parallel section modes
+MAX_PARALLEL_UNITS = 16
+
 
+def run_chain(chain, *args, **kwargs):
+    """
+    Run an LLMChain through the LLM scheduler if one is configured.
+
+    The scheduler waits for the request and token rate limits and a free call slot, and retries the call on rate
+    limits and other transient errors. Every call is traced as an "llm_call" span with the time spent waiting, the
+    token counts and the retries.
+
+    Args:
+        chain (LLMChain): The LLMChain to run.
+        *args: Positional inputs passed to chain.run.
+        **kwargs: Keyword inputs passed to chain.run.
 
-def initialize_chain(template_settings, llm_openai):
+    Returns:
+        str: The raw response of the chain.
+    """
+    model_name = getattr(chain.llm, "model_name", "gpt-3.5-turbo")
+    tracer = instrumentation.tracer
+    callbacks = [UsageCallbackHandler(tracer, model_name)] if tracer.enabled else []
+    with tracer.span("llm_call", chain=(chain.metadata or {}).get("settings"), model=model_name):
+        scheduler = llm_scheduler
+        if scheduler is None:
+            return chain.run(*args, callbacks=callbacks, **kwargs)
+
+        prompt_tokens = 0
+        if scheduler.token_bucket is not None:
+            inputs = kwargs if kwargs else {chain.prompt.input_variables[0]: args[0]}
+            prompt_tokens = count_tokens(chain.prompt.format(**inputs), model_name)
+        usage = TokenUsageCallbackHandler()
+        return scheduler.call(lambda: chain.run(*args, callbacks=callbacks + [usage], **kwargs), prompt_tokens,
+                              lambda: usage.total_tokens)
+
+
+def initialize_chain(template_settings, llm_openai, name=None):
     """
     Initialize an LLMChain and its corresponding output parser.
 
     Args:
         template_settings (dict): Template settings for initializing the chain.
         llm_openai (ChatOpenAI): An instance of the ChatOpenAI class for the language model.
+        name (str): Name of the settings, used to group the LLM calls in the trace.
 
     Returns:
         Tuple: Initialized LLMChain and output parser.
@@ -47,7 +101,7 @@ def initialize_chain(template_settings, llm_openai):
         partial_variables={"format_instructions": output_parser.get_format_instructions()}
     )
 
-    return LLMChain(llm=llm_openai, prompt=prompt), output_parser
+    return LLMChain(llm=llm_openai, prompt=prompt, metadata={"settings": name} if name else None), output_parser
 
 
 def process_section(section, chain, output_parser, prev_summary=""):
@@ -69,29 +123,35 @@ def process_section(section, chain, output_parser, prev_summary=""):
     section["metrics_description"] = ""
     section["mitigation"] = ""
     section["mitigation_description"] = ""
-    if section["text"]:
+    if not section["text"]:
+        return
+    with instrumentation.span("process_section") as span:
         try:
-            query = chain.run(section=section["text"], prev_summary=prev_summary)
+            query = run_chain(chain, section=section["text"], prev_summary=prev_summary)
         except openai.error.InvalidRequestError as e:
             print(e)
             print("Trying again without previous section summary...")
+            span["retries"] = 1
             try:
-                query = chain.run(section=section["text"], prev_summary="")
+                query = run_chain(chain, section=section["text"], prev_summary="")
             except openai.error.InvalidRequestError as e:
                 print(e)
                 print("Skipping...")
                 print(section)
+                span.update(status="skipped", reason=f"InvalidRequestError: {e}")
                 return
 
         try:
             output_chain = output_parser.parse(query)
         except langchain.schema.output_parser.OutputParserException:
+            span["retries"] = span.get("retries", 0) + 1
             try:
                 output_chain = output_parser.parse(query + "```")
             except langchain.schema.output_parser.OutputParserException as e:
                 print(e)
                 print("Skipping...")
                 print(query)
+                span.update(status="skipped", reason="OutputParserException")
                 return
 
         section["summary"] = output_chain["summary"]
@@ -101,16 +161,22 @@ def process_section(section, chain, output_parser, prev_summary=""):
         section["mitigation_description"] = output_chain["mitigation_description"]
 
 
-def summarize_for_paper(output_dict, input_key, output_keys, chain_type, output_parser_type):
+def summarize_for_paper(output_dict, input_key, output_keys, chain_type, output_parser_type, fan_in=8,
+                        max_input_tokens=None):
     """
         Generate diverse summaries for a paper using the corresponding LLMChain and output parser.
 
+        If the inputs do not fit into one call, they are aggregated with a tree of calls: chunks of at most fan_in
+        inputs are reduced in parallel and the intermediate results are reduced again until one result is left.
+
         Args:
             output_dict (dict): The dictionary containing paper sections and summary information.
             input_key (str): The key for the input text in each section.
             output_keys (list): The keys for the output summary information.
             chain_type (LLMChain): The LLMChain for generating corresponding responses. E.g., chain for summarizing the paper itself, metrics or mitigation techniques
             output_parser_type (StructuredOutputParser): The output parser for parsing generated responses.
+            fan_in (int): Maximum number of inputs aggregated in one call.
+            max_input_tokens (int): Maximum number of input tokens per call. None means no limit.
 
         Returns:
             None
@@ -118,72 +184,543 @@ def summarize_for_paper(output_dict, input_key, output_keys, chain_type, output_
     for output_key in output_keys:
         output_dict[output_key] = ""
 
-    summaries = [section[input_key] for section in output_dict["sections"]]
+    summaries = [str(section[input_key]) for section in output_dict["sections"] if section.get(input_key)]
 
-    if all(not sub_item for sub_item in summaries):
+    if not summaries:
         return
-    query = chain_type.run(summaries)
 
-    try:
-        output = output_parser_type.parse(query)
-    except langchain.schema.output_parser.OutputParserException:
+    def reduce_chunk(chunk):
         try:
-            output = output_parser_type.parse(query + "```")
+            query = run_chain(chain_type, chunk)
+        except openai.error.InvalidRequestError as e:
+            print(e)
+            return None
+        try:
+            return output_parser_type.parse(query)
         except langchain.schema.output_parser.OutputParserException:
+            try:
+                return output_parser_type.parse(query + "```")
+            except langchain.schema.output_parser.OutputParserException:
+                return None
+
+    def to_item(output):
+        if len(output_keys) == 1:
+            return str(output[output_keys[0]])
+        return "\n".join(f"{output_key}: {output[output_key]}" for output_key in output_keys)
+
+    model_name = getattr(chain_type.llm, "model_name", "gpt-3.5-turbo")
+    with instrumentation.span("summarize_for_paper", input_key=input_key, inputs=len(summaries)) as span:
+        output = tree_reduce(summaries, reduce_chunk, to_item, fan_in, max_input_tokens or float("inf"), model_name)
+        if output is None:
+            span.update(status="error", reason="No aggregated output")
             return
     for output_key in output_keys:
         output_dict[output_key] = output[output_key]
 
 
-def main(path_to_pdfs, output_path):
+def summarize_unit(unit, chain, output_parser, prev_summary=""):
     """
-        Main function to process PDF files and generate summaries.
+        Summarize the chunks of a planned unit one after another.
 
         Args:
-            path_to_pdfs (str): Path to the directory containing PDF files.
-            output_path (str): Output directory for JSON files.
+            unit (dict): The unit as returned by section_planner.plan_sections.
+            chain (LLMChain): The LLMChain for generating responses.
+            output_parser (StructuredOutputParser): The output parser for parsing generated responses.
+            prev_summary (str): The summary of previous section.
+
+        Returns:
+            list: The processed chunks, each a dict with the section output keys.
+        """
+    chunk_outputs = []
+    for chunk in unit["chunks"]:
+        chunk_section = {"text": chunk}
+        process_section(chunk_section, chain, output_parser, prev_summary)
+        prev_summary = chunk_section["summary"] or prev_summary
+        chunk_outputs.append(chunk_section)
+    return chunk_outputs
+
+
+def apply_unit_outputs(unit, sections, chunk_outputs):
+    """
+        Write the results of a planned unit back to the original sections.
+
+        A unit merged from several small sections is summarized in one call; its results are stored in the first
+        non-empty section, the other sections refer to it with "merged_into". The results of the chunks of a split
+        section are concatenated.
+
+        Args:
+            unit (dict): The unit as returned by section_planner.plan_sections.
+            sections (list): All sections of the paper.
+            chunk_outputs (list): The processed chunks as returned by summarize_unit.
+
+        Returns:
+            str: The summary of the unit, to be used as prev_summary of the next unit.
+        """
+    output_keys = SETTINGS["summarize_section"]["output_variables"]
+
+    section_indices = unit["section_indices"]
+    owner_index = next((i for i in section_indices if sections[i]["text"]), section_indices[0])
+    sections[owner_index].update(combine_chunk_outputs(chunk_outputs, output_keys))
+    if len(unit["chunks"]) > 1:
+        sections[owner_index]["chunks"] = len(unit["chunks"])
+    if len(section_indices) > 1:
+        sections[owner_index]["merged_sections"] = section_indices
+    for section_index in section_indices:
+        if section_index != owner_index:
+            sections[section_index].update({output_key: "" for output_key in output_keys})
+            sections[section_index]["merged_into"] = owner_index
+    return sections[owner_index]["summary"]
+
+
+def process_unit(unit, sections, chain, output_parser, prev_summary=""):
+    """
+        Process a planned unit of sections and write the results back to the original sections.
+
+        Args:
+            unit (dict): The unit as returned by section_planner.plan_sections.
+            sections (list): All sections of the paper.
+            chain (LLMChain): The LLMChain for generating responses.
+            output_parser (StructuredOutputParser): The output parser for parsing generated responses.
+            prev_summary (str): The summary of previous section.
+
+        Returns:
+            str: The summary of the unit, to be used as prev_summary of the next unit.
+        """
+    return apply_unit_outputs(unit, sections, summarize_unit(unit, chain, output_parser, prev_summary))
+
+
+def process_units_in_parallel(units, sections, chain, output_parser, prev_summary, refine=False,
+                              model_name="gpt-3.5-turbo"):
+    """
+        Process planned units in parallel instead of waiting for the summary of the previous unit.
+
+        Each unit gets a local extractive summary of the previous unit as context, so all units can be sent at once.
+        With refine, a second parallel pass gives each unit the LLM summary of the previous unit from the first pass.
+
+        Args:
+            units (list): The units to process, in the order of the paper.
+            sections (list): All sections of the paper.
+            chain (LLMChain): The LLMChain for generating responses.
+            output_parser (StructuredOutputParser): The output parser for parsing generated responses.
+            prev_summary (str): The summary of the section before the first unit.
+            refine (bool): Whether to run the second pass.
+            model_name (str): Name of the OpenAI model.
 
         Returns:
             None
         """
-    host = 'http://127.0.0.1'
-    port = '8080'
+    if not units:
+        return
+    contexts = [prev_summary] + [extractive_summary("\n\n".join(unit["chunks"])) for unit in units[:-1]]
+    contexts = [truncate_to_tokens(context, PREV_SUMMARY_TOKENS, model_name) for context in contexts]
 
-    llm_openai = ChatOpenAI(
-        model_name="gpt-3.5-turbo",
-        openai_api_key=openai_api_key,  # Use the API key from the environment variable
-        temperature=0.3
-    )
+    # The spans of the worker threads belong to the paper of the calling thread
+    @instrumentation.propagate
+    def summarize(unit, context):
+        return summarize_unit(unit, chain, output_parser, context)
+
+    with ThreadPoolExecutor(max_workers=min(len(units), MAX_PARALLEL_UNITS)) as executor:
+        unit_outputs = list(executor.map(summarize, units, contexts))
+        if refine:
+            output_keys = SETTINGS["summarize_section"]["output_variables"]
+            first_pass_summaries = [combine_chunk_outputs(chunk_outputs, output_keys)["summary"]
+                                    for chunk_outputs in unit_outputs[:-1]]
+            contexts = [contexts[0]] + [truncate_to_tokens(summary, PREV_SUMMARY_TOKENS, model_name) or context
+                                        for summary, context in zip(first_pass_summaries, contexts[1:])]
+            unit_outputs = list(executor.map(summarize, units, contexts))
+
+    for unit, chunk_outputs in zip(units, unit_outputs):
+        apply_unit_outputs(unit, sections, chunk_outputs)
+
+
+def max_input_tokens(chain, context_window, model_name, reserved_tokens=COMPLETION_TOKENS):
+    """
+        Compute how many tokens of input text fit into one call of a chain.
+
+        Args:
+            chain (LLMChain): The LLMChain to compute the budget for.
+            context_window (int): Context window of the model in tokens.
+            model_name (str): Name of the OpenAI model.
+            reserved_tokens (int): Tokens kept free, e.g. for the answer of the model.
+
+        Returns:
+            int: Maximum number of input tokens per call.
+        """
+    empty_inputs = {input_variable: "" for input_variable in chain.prompt.input_variables}
+    prompt_tokens = count_tokens(chain.prompt.format(**empty_inputs), model_name)
+    return max(1, context_window - prompt_tokens - reserved_tokens)
+
+
+def triage_paper(sections, threshold=1.0):
+    """
+        Triage the sections of a paper locally and fill in the results of the sections that skip the LLM.
+
+        Every section gets a "triage" entry with the decision, its relevance score and the reason. Sections decided
+        "extractive" get a local extractive summary, sections decided "skip" empty results.
+
+        Args:
+            sections (list): All sections of the paper.
+            threshold (float): Minimum relevance score of a section to be sent to the LLM, see
+                section_triage.triage_sections.
 
-    chain, output_parser = initialize_chain(SETTINGS["summarize_section"], llm_openai)
-    chain_overall, output_parser_overall = initialize_chain(SETTINGS["summarize_paper"], llm_openai)
-    chain_metrics, output_parser_metrics = initialize_chain(SETTINGS["aggregate_metrics"], llm_openai)
-    chain_mitigation, output_parser_mitigation = initialize_chain(SETTINGS["aggregate_mitigation"], llm_openai)
+        Returns:
+            list: The indices of the sections to summarize with the LLM.
+        """
+    output_keys = SETTINGS["summarize_section"]["output_variables"]
+    llm_indices = []
+    for section_index, (section, triage) in enumerate(zip(sections, triage_sections(sections, threshold))):
+        section["triage"] = triage
+        if triage["decision"] == "llm":
+            llm_indices.append(section_index)
+            continue
+        section.update({output_key: "" for output_key in output_keys})
+        if triage["decision"] == "extractive":
+            section["summary"] = extractive_summary(section["text"])
+
+    decisions = Counter(section["triage"]["decision"] for section in sections)
+    instrumentation.annotate(**{f"triage_{decision}": decisions[decision] for decision in DECISIONS})
+    return llm_indices
+
+
+def initialize_chains(llm):
+    """
+    Initialize all chains and output parsers defined in SETTINGS.
+
+    Args:
+        llm (BaseChatModel): The language model shared by all chains.
 
-    for file in Path(path_to_pdfs).glob("*.pdf"):
-        output_dict = parse_pdf(host, file, port=port)
+    Returns:
+        dict: Mapping of the settings name to a tuple of LLMChain and output parser.
+    """
+    return {name: initialize_chain(template_settings, llm, name) for name, template_settings in SETTINGS.items()}
 
-        prev_summary = ""
-        for section in output_dict["sections"]:
-            process_section(section, chain, output_parser, prev_summary)
-            prev_summary = section.get("summary", "")
 
-        summarize_for_paper(output_dict, "summary", ["overall_summary", "contributions", "further_research"],
-                            chain_overall, output_parser_overall)
-        summarize_for_paper(output_dict, "metrics_description", ["metrics_aggregated"], chain_metrics, output_parser_metrics)
-        summarize_for_paper(output_dict, "mitigation_description", ["mitigations_aggregated"], chain_mitigation,
-                            output_parser_mitigation)
+def process_paper(file, chains, output_path, parse_pool, checkpoint_dir=None, parse_cache_dir=None,
+                  context_window=4096, min_section_tokens=256, aggregation_fan_in=8, section_mode="sequential",
+                  corpus=None, write_json=True, triage_threshold=1.0, parsed=None):
+    """
+        Parse a single PDF file, summarize its sections and the whole paper and save the result as JSON.
 
-        output_file_name = str(os.path.basename(file)).split(".pdf")[0] + ".json"
-        output_file_path = os.path.join(output_path, output_file_name)
+        If a checkpoint directory is given, the progress is saved after every section. A paper that was already
+        processed with the same PDF content, prompt settings and section scheduling parameters is skipped, a
+        partially processed paper resumes after its last completed section.
+
+        Args:
+            file (Path): Path to the PDF file.
+            chains (dict): Chains and output parsers as returned by initialize_chains.
+            output_path (str): Output directory for JSON files.
+            parse_pool (ParseBackendPool): The science-parse servers.
+            checkpoint_dir (str): Directory for the checkpoints. None disables checkpointing.
+            parse_cache_dir (str): Directory of the science-parse result cache. None disables the cache.
+            context_window (int): Context window of the model in tokens, used to plan the section calls.
+            min_section_tokens (int): Smaller adjacent sections are merged into one call.
+            aggregation_fan_in (int): Maximum number of section results aggregated in one call.
+            section_mode (str): "sequential" passes the LLM summary of each section to the next one, "parallel"
+                summarizes all sections at once with a local extractive summary of the previous section as context,
+                "refine" adds a second parallel pass with the LLM summaries of the first pass as context.
+            corpus (CorpusStore): Corpus store the paper is appended to. None writes no corpus store.
+            write_json (bool): Whether to write the paper as JSON file to output_path.
+            triage_threshold (float): Sections without core heading and with a lower relevance score get a local
+                extractive summary instead of an LLM call, see triage_paper. None sends every section to the LLM.
+            parsed (dict): The output of science-parse if the PDF was already parsed, e.g. by an earlier stage of
+                a streaming pipeline. None parses the PDF with parse_pool if needed.
+
+        Returns:
+            str: Path to the written JSON file, None if only the corpus store is written.
+        """
+    chain, output_parser = chains["summarize_section"]
+    chain_overall, output_parser_overall = chains["summarize_paper"]
+    chain_metrics, output_parser_metrics = chains["aggregate_metrics"]
+    chain_mitigation, output_parser_mitigation = chains["aggregate_mitigation"]
+
+    paper_key = str(os.path.basename(file)).split(".pdf")[0]
+    output_file_path = os.path.join(output_path, paper_key + ".json") if write_json else None
+
+    checkpoint = None
+    pdf_sha256 = None
+    if checkpoint_dir is not None:
+        checkpoint_file = checkpoint_path(checkpoint_dir, file)
+        pdf_sha256 = file_sha256(file)
+        # Outputs of another section scheduling are not reused, so the modes and thresholds can be compared
+        prompt_settings_hash = settings_hash(processing={
+            "context_window": context_window, "min_section_tokens": min_section_tokens,
+            "aggregation_fan_in": aggregation_fan_in, "section_mode": section_mode,
+            "triage_threshold": triage_threshold,
+        })
+        checkpoint = load_checkpoint(checkpoint_file, pdf_sha256, prompt_settings_hash)
+        output_exists = ((not write_json or os.path.exists(output_file_path)) and
+                         (corpus is None or paper_key in corpus))
+        if checkpoint is not None and checkpoint["done"] and output_exists:
+            print(f"Skipping {file}, already processed")
+            instrumentation.annotate(status="skipped", reason="Already processed")
+            return output_file_path
+
+    if checkpoint is None or checkpoint["done"]:
+        output_dict = parsed
+        if output_dict is None:
+            output_dict = parse_pdf_cached(parse_pool, file, cache_dir=parse_cache_dir, pdf_sha256=pdf_sha256)
+        if output_dict is None:
+            raise ValueError(f"science-parse could not parse {file}")
+        completed_sections = 0
+        if checkpoint_dir is not None:
+            checkpoint = {"pdf_sha256": pdf_sha256, "settings_hash": prompt_settings_hash, "done": False,
+                          "completed_sections": 0, "paper": output_dict}
+            save_checkpoint(checkpoint_file, checkpoint)
+    else:
+        output_dict = checkpoint["paper"]
+        completed_sections = checkpoint["completed_sections"]
+        print(f"Resuming {file} after section {completed_sections}")
+
+    model_name = getattr(chain.llm, "model_name", "gpt-3.5-turbo")
+    sections = output_dict["sections"]
+    section_tokens = max_input_tokens(chain, context_window, model_name, PREV_SUMMARY_TOKENS + COMPLETION_TOKENS)
+    if triage_threshold is None:
+        llm_indices = list(range(len(sections)))
+    else:
+        llm_indices = triage_paper(sections, triage_threshold)
+    units = plan_sections([sections[i] for i in llm_indices], section_tokens, min_section_tokens, model_name)
+    for unit in units:
+        unit["section_indices"] = [llm_indices[i] for i in unit["section_indices"]]
+
+    prev_summary = ""
+    if completed_sections:
+        last_section_index = sections[completed_sections - 1].get("merged_into", completed_sections - 1)
+        prev_summary = sections[last_section_index].get("summary", "")
+    pending_units = [unit for unit in units if unit["section_indices"][-1] >= completed_sections]
+    if section_mode == "sequential":
+        for unit in pending_units:
+            prev_summary = truncate_to_tokens(prev_summary, PREV_SUMMARY_TOKENS, model_name)
+            prev_summary = process_unit(unit, sections, chain, output_parser, prev_summary) or prev_summary
+            if checkpoint is not None:
+                checkpoint["completed_sections"] = unit["section_indices"][-1] + 1
+                save_checkpoint(checkpoint_file, checkpoint)
+    else:
+        process_units_in_parallel(pending_units, sections, chain, output_parser, prev_summary,
+                                  section_mode == "refine", model_name)
+        if checkpoint is not None:
+            checkpoint["completed_sections"] = len(sections)
+            save_checkpoint(checkpoint_file, checkpoint)
+
+    # The three paper-level aggregations are independent of each other
+    aggregations = [
+        ("summary", ["overall_summary", "contributions", "further_research"], chain_overall, output_parser_overall),
+        ("metrics_description", ["metrics_aggregated"], chain_metrics, output_parser_metrics),
+        ("mitigation_description", ["mitigations_aggregated"], chain_mitigation, output_parser_mitigation),
+    ]
+    with ThreadPoolExecutor(max_workers=len(aggregations)) as executor:
+        futures = [
+            executor.submit(instrumentation.propagate(summarize_for_paper), output_dict, input_key, output_keys,
+                            chain_type, output_parser_type, aggregation_fan_in,
+                            max_input_tokens(chain_type, context_window, model_name))
+            for input_key, output_keys, chain_type, output_parser_type in aggregations
+        ]
+        for future in futures:
+            future.result()
+
+    if write_json:
         with open(output_file_path, "w", encoding="utf-8") as f:
             json.dump(output_dict, f, ensure_ascii=False, indent=4)
+    if corpus is not None:
+        corpus.append(paper_key, output_dict)
+
+    if checkpoint is not None:
+        # The output file holds the paper now, the checkpoint only has to remember that it is done
+        checkpoint.update({"done": True, "completed_sections": len(sections), "paper": None})
+        save_checkpoint(checkpoint_file, checkpoint)
+    return output_file_path
+
+
+def initialize_llm(llm=None, max_concurrent_llm_calls=None, llm_cache_path=None, llm_cache_max_mb=512,
+                   requests_per_minute=None, tokens_per_minute=None, max_retries=6):
+    """
+        Set up the LLM scheduler and cache, once per process. Every LLM call made with run_chain afterwards goes
+        through the scheduler.
+
+        Args:
+            llm (BaseChatModel): Language model to use instead of gpt-3.5-turbo, e.g. a fake model for offline runs.
+            max_concurrent_llm_calls (int): Maximum number of LLM calls in flight, see LLMScheduler.
+            llm_cache_path (str): Path to the SQLite file caching the LLM responses. None disables the cache.
+            llm_cache_max_mb (float): Maximum size of the LLM cache in megabytes.
+            requests_per_minute (float): Requests per minute allowed for the OpenAI account. None means no limit.
+            tokens_per_minute (float): Tokens per minute allowed for the OpenAI account. None means no limit.
+            max_retries (int): Number of times an LLM call is sent again after a rate limit or a transient error.
+
+        Returns:
+            BaseChatModel: The language model, with the retries of the API client left to the scheduler.
+        """
+    global llm_scheduler
+
+    if llm is None:
+        llm = ChatOpenAI(
+            model_name="gpt-3.5-turbo",
+            openai_api_key=openai_api_key,  # Use the API key from the environment variable
+            temperature=0.3,
+            max_retries=1  # Retries are done by the scheduler, which also adapts the concurrency to rate limits
+        )
+
+    llm_scheduler = LLMScheduler(requests_per_minute, tokens_per_minute, max_concurrent_llm_calls,
+                                 max_retries=max_retries)
+
+    if llm_cache_path:
+        langchain.llm_cache = LRUSQLiteCache(llm_cache_path, max_size_mb=llm_cache_max_mb)
+
+    return llm
+
+
+def initialize_pipeline(llm=None, max_concurrent_llm_calls=None, llm_cache_path=None, llm_cache_max_mb=512,
+                        requests_per_minute=None, tokens_per_minute=None, max_retries=6):
+    """
+        Set up the LLM scheduler and cache and initialize the chains, once per process.
+
+        Args:
+            See initialize_llm.
+
+        Returns:
+            dict: The chains as returned by initialize_chains.
+        """
+    llm = initialize_llm(llm, max_concurrent_llm_calls, llm_cache_path, llm_cache_max_mb, requests_per_minute,
+                         tokens_per_minute, max_retries)
+    return initialize_chains(llm)
+
+
+def print_pipeline_stats(parse_pool):
+    """
+        Print the statistics of the LLM cache, the LLM scheduler and the science-parse servers.
+
+        Args:
+            parse_pool (ParseBackendPool): The science-parse servers.
+
+        Returns:
+            None
+        """
+    if isinstance(langchain.llm_cache, LRUSQLiteCache):
+        print(f"LLM cache: {langchain.llm_cache.stats()}")
+    print(f"LLM scheduler: {llm_scheduler.stats()}")
+    print(f"science-parse servers: {parse_pool.stats()}")
+
+
+def main(path_to_pdfs, output_path, max_concurrent_papers=1, max_concurrent_llm_calls=None, llm=None,
+         llm_cache_path=None, llm_cache_max_mb=512, checkpoint_dir=None, parse_cache_dir=None,
+         context_window=4096, min_section_tokens=256, aggregation_fan_in=8, section_mode="sequential",
+         corpus_path=None, write_json=True, trace_path=None, parse_endpoints=None,
+         parse_slots=2, parse_timeout=60, requests_per_minute=None, tokens_per_minute=None, max_retries=6,
+         triage_threshold=1.0, watch=False, poll_interval=2.0, status_path=None):
+    """
+        Main function to process PDF files and generate summaries.
+
+        Args:
+            path_to_pdfs (str): Path to the directory containing PDF files.
+            output_path (str): Output directory for JSON files.
+            max_concurrent_papers (int): Number of papers processed at the same time.
+            max_concurrent_llm_calls (int): Maximum number of LLM calls in flight across all papers. None means no limit
+                until the first rate-limit error; after rate-limit errors the limit is adapted, see LLMScheduler.
+            llm (BaseChatModel): Language model to use instead of gpt-3.5-turbo, e.g. a fake model for offline runs.
+            llm_cache_path (str): Path to the SQLite file caching the LLM responses. None disables the cache.
+            llm_cache_max_mb (float): Maximum size of the LLM cache in megabytes.
+            checkpoint_dir (str): Directory for the per-paper checkpoints. None disables skipping and resuming.
+            parse_cache_dir (str): Directory of the science-parse result cache. None disables the cache.
+            context_window (int): Context window of the model in tokens, used to plan the section calls.
+            min_section_tokens (int): Smaller adjacent sections are merged into one call.
+            aggregation_fan_in (int): Maximum number of section results aggregated in one call.
+            section_mode (str): How the sections of a paper are scheduled, one of SECTION_MODES.
+            corpus_path (str): Directory of a corpus store all papers are appended to. None writes no corpus store.
+            write_json (bool): Whether to write every paper as JSON file to output_path.
+            trace_path (str): Path to a JSONL file the timings, token counts and failures of all stages are appended
+                to. A report with percentiles per stage is printed at the end. None disables tracing.
+            parse_endpoints (list of str): URLs of the science-parse servers. Every PDF goes to the least loaded
+                healthy server and is moved to another one if its server fails, see ParseBackendPool.
+            parse_slots (int): Number of PDFs every science-parse server parses at the same time.
+            parse_timeout (int): Timeout of a science-parse request in seconds.
+            requests_per_minute (float): Requests per minute allowed for the OpenAI account. None means no limit.
+            tokens_per_minute (float): Tokens per minute allowed for the OpenAI account. None means no limit.
+            max_retries (int): Number of times an LLM call is sent again after a rate limit or a transient error.
+            triage_threshold (float): Minimum relevance score of a section without core heading to be sent to the
+                LLM, see section_triage.py. None sends every section to the LLM.
+            watch (bool): Whether to keep running and process new or changed PDF files in path_to_pdfs as they
+                arrive, see PDFWatcher. The chains, clients and caches stay warm between papers.
+            poll_interval (float): Seconds between two scans of path_to_pdfs in watch mode.
+            status_path (str): JSON file with queue depth, throughput and latency in watch mode. None writes no
+                status file.
+
+        Returns:
+            dict: Mapping of each PDF file to the raised exception for the papers that failed.
+        """
+    chains = initialize_pipeline(llm, max_concurrent_llm_calls, llm_cache_path, llm_cache_max_mb,
+                                 requests_per_minute, tokens_per_minute, max_retries)
+    parse_pool = ParseBackendPool(parse_endpoints, slots_per_backend=parse_slots, timeout=parse_timeout)
+    corpus = CorpusStore(corpus_path) if corpus_path else None
+
+    if trace_path:
+        instrumentation.configure(trace_path)
+
+    def process(file):
+        with instrumentation.span("paper", paper=file.stem):
+            return process_paper(file, chains, output_path, parse_pool, checkpoint_dir, parse_cache_dir,
+                                 context_window, min_section_tokens, aggregation_fan_in, section_mode, corpus,
+                                 write_json, triage_threshold)
+
+    failures = {}
+    if watch:
+        watcher = PDFWatcher(path_to_pdfs, process, max_concurrent_papers, poll_interval, status_path=status_path)
+        failures = watcher.run()
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_papers)) as executor:
+            futures = {executor.submit(process, file): file for file in Path(path_to_pdfs).glob("*.pdf")}
+            for future in as_completed(futures):
+                file = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    # One failing paper must not stop the others
+                    print(f"Failed to process {file}: {e}")
+                    failures[file] = e
+
+    print_pipeline_stats(parse_pool)
+    if trace_path:
+        print(instrumentation.tracer.report())
+        instrumentation.tracer.close()
+    return failures
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Summarize PDFs using LangChain")
     parser.add_argument('--path_to_pdfs', type=str, default="literature/pdfs/other", help="Path to the directory containing PDF files")
     parser.add_argument('--output_path', type=str, default="parsed_papers", help="Output directory for JSON files")
+    parser.add_argument('--max_concurrent_papers', type=int, default=1, help="Number of papers processed at the same time")
+    parser.add_argument('--max_concurrent_llm_calls', type=int, default=None, help="Maximum number of LLM calls in flight across all papers")
+    parser.add_argument('--requests_per_minute', type=float, default=None, help="Requests per minute allowed for the OpenAI account")
+    parser.add_argument('--tokens_per_minute', type=float, default=None, help="Tokens per minute allowed for the OpenAI account")
+    parser.add_argument('--max_retries', type=int, default=6, help="Number of times an LLM call is retried after a rate limit or a transient error")
+    parser.add_argument('--llm_cache_path', type=str, default="llm_cache.db", help="SQLite file caching the LLM responses. Pass an empty string to disable the cache")
+    parser.add_argument('--llm_cache_max_mb', type=float, default=512, help="Maximum size of the LLM cache in megabytes")
+    parser.add_argument('--parse_endpoints', type=str, nargs='+', default=DEFAULT_ENDPOINTS, help="URLs of the science-parse servers; every PDF goes to the least loaded healthy one. Use --max_concurrent_papers of at least the number of servers times --parse_slots to keep all of them busy")
+    parser.add_argument('--parse_slots', type=int, default=2, help="Number of PDFs every science-parse server parses at the same time")
+    parser.add_argument('--parse_timeout', type=int, default=60, help="Timeout of a science-parse request in seconds")
+    parser.add_argument('--parse_cache_dir', type=str, default="parse_cache", help="Directory where the science-parse results are cached. Pass an empty string to disable the cache")
+    parser.add_argument('--context_window', type=int, default=4096, help="Context window of the model in tokens, used to split oversized sections")
+    parser.add_argument('--min_section_tokens', type=int, default=256, help="Adjacent sections with fewer tokens are merged into one LLM call")
+    parser.add_argument('--aggregation_fan_in', type=int, default=8, help="Maximum number of section results aggregated in one LLM call")
+    parser.add_argument('--section_mode', type=str, default="sequential", choices=SECTION_MODES, help="How the sections of a paper are scheduled")
+    parser.add_argument('--corpus_path', type=str, default=None, help="Directory of a compact corpus store (append-only JSONL with an offset index) all papers are appended to")
+    parser.add_argument('--no_json', action='store_true', help="Do not write a JSON file per paper, e.g. when only the corpus store is needed")
+    parser.add_argument('--triage_threshold', type=float, default=1.0, help="Sections without core heading and with a lower keyword relevance score get a local extractive summary instead of an LLM call")
+    parser.add_argument('--no_triage', action='store_true', help="Send every non-empty section to the LLM")
+    parser.add_argument('--watch', action='store_true', help="Keep running and process new or changed PDF files in --path_to_pdfs as they arrive")
+    parser.add_argument('--poll_interval', type=float, default=2.0, help="Seconds between two scans of --path_to_pdfs in watch mode")
+    parser.add_argument('--status_path', type=str, default="watch_status.json", help="JSON file with queue depth, throughput and latency, updated after every scan in watch mode")
+    parser.add_argument('--trace_path', type=str, default=None, help="JSONL file the timings, token counts and failures of all stages are appended to; a report is printed at the end")
+    parser.add_argument('--debug', action='store_true', help="Print every prompt and response of langchain")
+    parser.add_argument('--checkpoint_dir', type=str, default="checkpoints", help="Directory for the per-paper checkpoints. Pass an empty string to reprocess every paper from scratch")
 
     args = parser.parse_args()
-    main(args.path_to_pdfs, args.output_path)
+    langchain.debug = args.debug
+    main(args.path_to_pdfs, args.output_path, args.max_concurrent_papers, args.max_concurrent_llm_calls,
+         llm_cache_path=args.llm_cache_path, llm_cache_max_mb=args.llm_cache_max_mb,
+         checkpoint_dir=args.checkpoint_dir or None, parse_cache_dir=args.parse_cache_dir or None,
+         context_window=args.context_window, min_section_tokens=args.min_section_tokens,
+         aggregation_fan_in=args.aggregation_fan_in, section_mode=args.section_mode,
+         corpus_path=args.corpus_path, write_json=not args.no_json, trace_path=args.trace_path,
+         parse_endpoints=args.parse_endpoints, parse_slots=args.parse_slots, parse_timeout=args.parse_timeout,
+         requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute,
+         max_retries=args.max_retries, triage_threshold=None if args.no_triage else args.triage_threshold,
+         watch=args.watch, poll_interval=args.poll_interval, status_path=args.status_path or None)
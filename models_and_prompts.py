@@ -1,5 +1,8 @@
 from langchain.output_parsers import ResponseSchema
 
+# Part of the key of every cached LLM response. Bump it to invalidate the cache without changing the templates.
+TEMPLATE_VERSION = "1"
+
 SETTINGS = {
     "summarize_section": {
         "template": """
@@ -73,3 +76,22 @@ SETTINGS = {
     }
 
 }
+
+# Prompts of the corpus-level catalog, kept apart from SETTINGS so they do not invalidate the per-paper checkpoints
+CATALOG_SETTINGS = {
+    "canonicalize_entry": {
+        "template": """
+            Here are the names and descriptions of one {kind} for the hallucinations of large language models, as found in different papers.
+            Names: {names}
+            Descriptions: {descriptions}
+            Give the canonical name and one description that covers all descriptions. If the names refer to different techniques, describe the most common one.
+            {format_instructions}
+            """,
+        "response_schemas": [ResponseSchema(name="canonical_name",
+                                            description="The canonical name of the metric or mitigation technique"),
+                             ResponseSchema(name="canonical_description",
+                                            description="The description of the metric or mitigation technique covering all given descriptions")],
+        "input_variables": ["kind", "names", "descriptions"],
+        "output_variables": ["canonical_name", "canonical_description"]
+    }
+}
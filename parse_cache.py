@@ -0,0 +1,117 @@
+import argparse
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import instrumentation
+from checkpoints import file_sha256
+from parse_pool import DEFAULT_ENDPOINTS, ParseBackendPool
+
+
+def parse_cache_path(cache_dir, pdf_sha256):
+    """
+    Return the path of the cached parse result of a PDF.
+
+    Args:
+        cache_dir (str): Directory where the parse results are cached.
+        pdf_sha256 (str): SHA-256 hash of the PDF file.
+
+    Returns:
+        Path: Path to the gzip-compressed JSON file.
+    """
+    return Path(cache_dir, pdf_sha256 + ".json.gz")
+
+
+def parse_pdf_cached(parse_pool, file, cache_dir=None, pdf_sha256=None):
+    """
+    Parse a PDF with science-parse, reusing the cached result for the same PDF content if there is one.
+
+    Args:
+        parse_pool (ParseBackendPool): The science-parse servers.
+        file (str or Path): Path to the PDF file.
+        cache_dir (str): Directory where the parse results are cached. None disables the cache.
+        pdf_sha256 (str): SHA-256 hash of the PDF file, computed if not given.
+
+    Returns:
+        dict: The output of science-parse or None if the PDF could not be parsed.
+    """
+    file = Path(file)
+    with instrumentation.span("parse_pdf", paper=file.stem, file=file.name, cache_hit=False) as span:
+        if cache_dir is None:
+            output_dict = parse_pool.parse_pdf(file)
+            if output_dict is None:
+                span.update(status="error", reason="science-parse returned no result")
+            return output_dict
+
+        if pdf_sha256 is None:
+            pdf_sha256 = file_sha256(file)
+        cache_file = parse_cache_path(cache_dir, pdf_sha256)
+        try:
+            with gzip.open(cache_file, "rt", encoding="utf-8") as f:
+                output_dict = json.load(f)
+            span["cache_hit"] = True
+            return output_dict
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring broken parse cache entry {cache_file}: {e}")
+
+        output_dict = parse_pool.parse_pdf(file)
+        if output_dict is None:
+            # Failed parses are not cached, so they are retried on the next run
+            span.update(status="error", reason="science-parse returned no result")
+            return None
+
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with gzip.open(tmp_file, "wt", encoding="utf-8") as f:
+            json.dump(output_dict, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, cache_file)
+        return output_dict
+
+
+def main(path_to_pdfs, cache_dir, max_workers=None, parse_endpoints=None, parse_slots=2, parse_timeout=60):
+    """
+    Warm up the parse cache by parsing all PDF files in a directory.
+
+    Args:
+        path_to_pdfs (str): Path to the directory containing PDF files.
+        cache_dir (str): Directory where the parse results are cached.
+        max_workers (int): Number of PDFs sent to science-parse at the same time. None keeps all slots of all
+            servers busy.
+        parse_endpoints (list of str): URLs of the science-parse servers.
+        parse_slots (int): Number of PDFs every science-parse server parses at the same time.
+        parse_timeout (int): Timeout of a science-parse request in seconds.
+
+    Returns:
+        None
+    """
+    files = sorted(Path(path_to_pdfs).glob("*.pdf"))
+    parse_pool = ParseBackendPool(parse_endpoints, slots_per_backend=parse_slots, timeout=parse_timeout)
+
+    def warm_up(file):
+        return parse_pdf_cached(parse_pool, file, cache_dir=cache_dir) is not None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers or parse_pool.capacity)) as executor:
+        parsed = list(executor.map(warm_up, files))
+
+    for file, success in zip(files, parsed):
+        if not success:
+            print(f"Failed to parse {file}")
+    print(f"Parse cache contains {sum(parsed)} of {len(files)} PDF files from {path_to_pdfs}")
+    print(f"science-parse servers: {parse_pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse all PDFs in a directory with science-parse and cache the results.")
+    parser.add_argument('--path_to_pdfs', type=str, default="literature/pdfs/other", help="Path to the directory containing PDF files")
+    parser.add_argument('--cache_dir', type=str, default="parse_cache", help="Directory where the parse results are cached")
+    parser.add_argument('--max_workers', type=int, default=None, help="Number of PDFs sent to science-parse at the same time (default: all slots of all servers)")
+    parser.add_argument('--parse_endpoints', type=str, nargs='+', default=DEFAULT_ENDPOINTS, help="URLs of the science-parse servers; PDFs go to the least loaded healthy one")
+    parser.add_argument('--parse_slots', type=int, default=2, help="Number of PDFs every science-parse server parses at the same time")
+    parser.add_argument('--parse_timeout', type=int, default=60, help="Timeout of a science-parse request in seconds")
+
+    args = parser.parse_args()
+    main(args.path_to_pdfs, args.cache_dir, args.max_workers, args.parse_endpoints, args.parse_slots, args.parse_timeout)
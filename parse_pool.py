@@ -0,0 +1,209 @@
+import socket
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from science_parse_api.api import parse_pdf
+
+import instrumentation
+
+DEFAULT_ENDPOINTS = ["http://127.0.0.1:8080"]
+
+
+def split_endpoint(endpoint):
+    """
+    Split the URL of a science-parse server into the host and port arguments of science_parse_api.parse_pdf.
+
+    Args:
+        endpoint (str): URL of the server, e.g. "http://127.0.0.1:8080".
+
+    Returns:
+        tuple: The host with scheme, e.g. "http://127.0.0.1", and the port as string, "" if the URL has none.
+    """
+    parts = urlsplit(endpoint if "://" in endpoint else f"http://{endpoint}")
+    return f"{parts.scheme}://{parts.hostname}", str(parts.port or "")
+
+
+class ParseBackend:
+    """State of one science-parse server in a ParseBackendPool."""
+
+    def __init__(self, endpoint, slots):
+        self.endpoint = endpoint
+        self.host, self.port = split_endpoint(endpoint)
+        self.slots = slots
+        self.in_flight = 0
+        self.healthy = True
+        self.checking = False
+        self.last_check = 0.0
+        self.parsed = 0
+        self.failures = 0
+        self.busy_time = 0.0
+
+    def load(self):
+        return self.in_flight / self.slots
+
+    def check_health(self, timeout=2.0):
+        """
+        Check whether the server accepts connections.
+
+        Args:
+            timeout (float): Timeout of the connection attempt in seconds.
+
+        Returns:
+            bool: Whether the server is reachable. The pool stores the result under its lock.
+        """
+        parts = urlsplit(self.host)
+        try:
+            with socket.create_connection((parts.hostname, int(self.port or 80)), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+
+class ParseBackendPool:
+    """
+    Pool of science-parse servers with health checks, least-loaded dispatch, timeouts and failover.
+
+    Every server runs at most `slots_per_backend` parses at the same time; a parse goes to the healthy server with
+    the lowest share of busy slots and waits if all of them are busy, so any number of threads can share the pool
+    and keep all servers busy. If a parse fails, the server is checked: an unreachable server is marked unhealthy
+    and the parse is moved to another server without counting as an attempt, a reachable server counts the failure
+    as an attempt and the parse is tried on another server until max_attempts is reached. Unhealthy servers are
+    checked again after health_interval seconds; if no server is healthy, a parse waits for these checks up to
+    max_wait seconds, so a restarting server only delays the papers instead of failing them.
+    """
+
+    def __init__(self, endpoints=None, slots_per_backend=2, timeout=60, max_attempts=2, health_interval=30.0,
+                 max_wait=120.0, parse=parse_pdf):
+        """
+        Args:
+            endpoints (list of str): URLs of the science-parse servers, e.g. ["http://127.0.0.1:8080"].
+            slots_per_backend (int): Number of parses every server runs at the same time.
+            timeout (int): Timeout of a parse request in seconds.
+            max_attempts (int): Number of servers a PDF is tried on if it fails on a reachable server.
+            health_interval (float): Seconds after which an unhealthy server is checked again.
+            max_wait (float): Seconds a parse waits for an unhealthy server to come back before it fails.
+            parse (callable): Function with the signature of science_parse_api.parse_pdf, e.g. a stub for tests.
+        """
+        self.backends = [ParseBackend(endpoint, max(1, slots_per_backend))
+                         for endpoint in dict.fromkeys(endpoints or DEFAULT_ENDPOINTS)]
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.health_interval = health_interval
+        self.max_wait = max_wait
+        self.parse = parse
+        self._condition = threading.Condition()
+        threads = [threading.Thread(target=self._check, args=(backend,)) for backend in self.backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    @property
+    def capacity(self):
+        """Number of parses the healthy servers run at the same time."""
+        return sum(backend.slots for backend in self.backends if backend.healthy) or 1
+
+    def _check(self, backend):
+        # The connection attempt can take seconds, so it runs without the lock and only its result is stored
+        # under it
+        healthy = backend.check_health()
+        with self._condition:
+            backend.healthy = healthy
+            backend.checking = False
+            backend.last_check = time.monotonic()
+            self._condition.notify_all()
+        return healthy
+
+    def _recheck_unhealthy(self):
+        now = time.monotonic()
+        with self._condition:
+            due = [backend for backend in self.backends if not backend.healthy and not backend.checking and
+                   now - backend.last_check >= self.health_interval]
+            for backend in due:
+                backend.checking = True
+        for backend in due:
+            self._check(backend)
+
+    def _acquire(self, excluded, deadline):
+        while True:
+            self._recheck_unhealthy()
+            with self._condition:
+                candidates = [backend for backend in self.backends if backend.healthy and backend not in excluded]
+                if not candidates:
+                    waiting = [backend for backend in self.backends if backend not in excluded]
+                    now = time.monotonic()
+                    if not waiting or now >= deadline:
+                        return None
+                    # Wait for the next check of an unhealthy server, or for a running check to finish
+                    next_check = min(backend.last_check + self.health_interval for backend in waiting)
+                    self._condition.wait(timeout=max(0.0, min(next_check, deadline) - now))
+                    continue
+                free = [backend for backend in candidates if backend.in_flight < backend.slots]
+                if free:
+                    backend = min(free, key=lambda backend: (backend.load(), backend.parsed))
+                    backend.in_flight += 1
+                    return backend
+                self._condition.wait(timeout=self.health_interval)
+
+    def _release(self, backend, elapsed, success):
+        with self._condition:
+            backend.in_flight -= 1
+            backend.busy_time += elapsed
+            if success:
+                backend.parsed += 1
+            else:
+                backend.failures += 1
+            self._condition.notify_all()
+
+    def parse_pdf(self, file):
+        """
+        Parse a PDF on the least loaded healthy server, failing over to other servers.
+
+        Args:
+            file (str or Path): Path to the PDF file.
+
+        Returns:
+            dict: The output of science-parse or None if the PDF could not be parsed on any server.
+        """
+        file = Path(file)
+        deadline = time.monotonic() + self.max_wait
+        excluded = set()
+        attempts = 0
+        while attempts < self.max_attempts:
+            backend = self._acquire(excluded, deadline)
+            if backend is None:
+                print(f"No healthy science-parse server left for {file}")
+                return None
+            start = time.perf_counter()
+            output_dict = None
+            try:
+                output_dict = self.parse(backend.host, file, port=backend.port, timeout=self.timeout)
+            finally:
+                self._release(backend, time.perf_counter() - start, output_dict is not None)
+            if output_dict is not None:
+                instrumentation.annotate(parse_backend=backend.endpoint)
+                return output_dict
+
+            if self._check(backend):
+                # The server is up but failed on this PDF, so it is not tried again
+                excluded.add(backend)
+                attempts += 1
+                print(f"science-parse at {backend.endpoint} could not parse {file}")
+            else:
+                # It may come back after a restart and is used again once a check finds it healthy
+                print(f"science-parse at {backend.endpoint} is not reachable, trying another server")
+        return None
+
+    def stats(self):
+        """
+        Return the state and the counters of every server.
+
+        Returns:
+            dict: Per server URL, whether it is healthy and the number of parsed PDFs, failures and busy seconds.
+        """
+        with self._condition:
+            return {backend.endpoint: {"healthy": backend.healthy, "parsed": backend.parsed,
+                                       "failures": backend.failures, "busy_time": round(backend.busy_time, 2)}
+                    for backend in self.backends}
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from instrumentation import percentile
+
+# Completions of this many recent seconds are used for the throughput in the status file
+THROUGHPUT_WINDOW = 300
+
+
+class PDFWatcher:
+    """
+    Watch a directory and process every new or changed PDF file as soon as it is complete.
+
+    The directory is polled every poll_interval seconds; a PDF is queued once it has not been modified for
+    settle_seconds, so files that are still being copied are not picked up. A file that changes
+    while it is processed is queued again afterwards. A file whose processing failed, e.g. because the LLM or all
+    science-parse servers were unavailable, is queued again after retry_delay seconds, doubling the delay with every
+    failure, until max_attempts runs of its content have failed; changing the file starts over. The files are processed by a thread pool of max_workers
+    threads, so the caller keeps its chains, clients and caches warm across all files. Queue depth, throughput and
+    latency from arrival to finished output are written to a JSON status file after every poll.
+    """
+
+    def __init__(self, path_to_pdfs, process, max_workers=1, poll_interval=2.0, settle_seconds=1.0,
+                 status_path=None, retry_delay=60.0, max_attempts=4):
+        """
+        Args:
+            path_to_pdfs (str): Path to the watched directory.
+            process (callable): Function processing one PDF file given as Path.
+            max_workers (int): Number of files processed at the same time.
+            poll_interval (float): Seconds between two scans of the directory.
+            settle_seconds (float): Seconds a file must be unchanged before it is queued.
+            status_path (str): Path to the JSON status file. None writes no status file.
+            retry_delay (float): Seconds before a failed file is processed again the first time.
+            max_attempts (int): Number of times a file is processed before it is only retried once it changes.
+        """
+        self.path_to_pdfs = Path(path_to_pdfs)
+        self.process = process
+        self.max_workers = max(1, max_workers)
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.status_path = status_path
+        self.retry_delay = retry_delay
+        self.max_attempts = max(1, max_attempts)
+        self.failures = {}
+        self._seen = {}
+        self._pending = {}
+        self._queued = set()
+        self._running = set()
+        self._requeue = set()
+        self._attempts = {}
+        self._retry_at = {}
+        self._processed = 0
+        self._completions = deque()
+        self._latencies = deque(maxlen=1000)
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def scan(self):
+        """
+        Return the PDF files that are new or changed since they were last queued and are no longer written to.
+
+        Returns:
+            list of tuple: The path and the arrival time of every file to queue, in name order.
+        """
+        now = time.time()
+        ready = []
+        try:
+            entries = sorted(os.scandir(self.path_to_pdfs), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return ready
+        for entry in entries:
+            if not entry.name.endswith(".pdf") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._seen.get(entry.path) == signature:
+                continue
+            with self._lock:
+                if now < self._retry_at.get(entry.path, 0):
+                    # Failed recently, wait before trying again
+                    continue
+            # The arrival of a file is the scan that first saw its new content
+            arrived = self._pending.get(entry.path, now)
+            if now - stat.st_mtime < self.settle_seconds:
+                # Still being written
+                self._pending[entry.path] = arrived
+                continue
+            self._pending.pop(entry.path, None)
+            with self._lock:
+                if self._retry_at.pop(entry.path, None) is None:
+                    # New content, not a retry: it gets all attempts again
+                    self._attempts.pop(entry.path, None)
+            self._seen[entry.path] = signature
+            ready.append((Path(entry.path), arrived))
+        return ready
+
+    def _run(self, file, arrived):
+        with self._lock:
+            self._queued.discard(file)
+            self._running.add(file)
+        try:
+            self.process(file)
+        except Exception as e:
+            # One failing paper must not stop the watcher
+            print(f"Failed to process {file}: {e}")
+            with self._lock:
+                self.failures[file] = e
+                attempts = self._attempts.get(str(file), 0) + 1
+                self._attempts[str(file)] = attempts
+                if attempts < self.max_attempts:
+                    # Forget the file, so a scan after the delay queues it again
+                    delay = self.retry_delay * 2 ** (attempts - 1)
+                    self._retry_at[str(file)] = time.time() + delay
+                    self._seen.pop(str(file), None)
+                    print(f"Retrying {file} in {delay:.0f} seconds")
+                else:
+                    print(f"Giving up on {file} after {attempts} attempts until it changes")
+        else:
+            with self._lock:
+                self.failures.pop(file, None)
+                self._attempts.pop(str(file), None)
+        finally:
+            now = time.time()
+            with self._lock:
+                self._running.discard(file)
+                self._processed += 1
+                self._completions.append(now)
+                self._latencies.append(now - arrived)
+                if file in self._requeue:
+                    # Changed while it was processed: scan it again
+                    self._requeue.discard(file)
+                    self._seen.pop(str(file), None)
+
+    def status(self):
+        """
+        Return the current state of the watcher.
+
+        Returns:
+            dict: Queue depth, files in progress, processed files (including failed ones), files whose last run
+                failed, papers per minute over the last THROUGHPUT_WINDOW seconds and the p50/p95 seconds from the
+                arrival of a file to its finished output.
+        """
+        now = time.time()
+        with self._lock:
+            while self._completions and now - self._completions[0] > THROUGHPUT_WINDOW:
+                self._completions.popleft()
+            window = min(THROUGHPUT_WINDOW, max(1e-9, now - self._started))
+            latencies = sorted(self._latencies)
+            return {
+                "path_to_pdfs": str(self.path_to_pdfs),
+                "started": self._started,
+                "updated": now,
+                "queued": len(self._queued),
+                "in_progress": len(self._running),
+                "processed": self._processed,
+                "failed": len(self.failures),
+                "papers_per_min": len(self._completions) / window * 60,
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+            }
+
+    def write_status(self):
+        """Write the status atomically to status_path, if given."""
+        if not self.status_path:
+            return
+        tmp_path = f"{self.status_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.status(), f, indent=4)
+        os.replace(tmp_path, self.status_path)
+
+    def stop(self):
+        """Stop watching; files already queued are still processed."""
+        self._stop.set()
+
+    def run(self):
+        """
+        Watch the directory until stop() is called or the process is interrupted.
+
+        Returns:
+            dict: Mapping of each PDF file to the raised exception for the files whose last run failed.
+        """
+        print(f"Watching {self.path_to_pdfs} for new PDF files, press Ctrl+C to stop")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while not self._stop.is_set():
+                    for file, arrived in self.scan():
+                        with self._lock:
+                            if file in self._queued:
+                                continue
+                            if file in self._running:
+                                self._requeue.add(file)
+                                continue
+                            self._queued.add(file)
+                        executor.submit(self._run, file, arrived)
+                    self.write_status()
+                    self._stop.wait(self.poll_interval)
+            except KeyboardInterrupt:
+                print(f"Stopping, waiting for {len(self._queued) + len(self._running)} queued papers")
+        self.write_status()
+        return self.failures
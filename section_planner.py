@@ -0,0 +1,181 @@
+import math
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens kept free for the structured answer of the model
+COMPLETION_TOKENS = 1024
+# Tokens reserved for the summary of the previous section
+PREV_SUMMARY_TOKENS = 256
+# Separators tried one after another when an oversized section has to be split
+SPLIT_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+
+@lru_cache(maxsize=None)
+def _encoding(model_name):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads the encodings on first use, which fails on machines without internet access
+        print(f"Could not load the tokenizer for {model_name}, estimating token counts instead: {e}")
+        return None
+
+
+def count_tokens(text, model_name="gpt-3.5-turbo"):
+    """
+    Count the tokens of a text with the tokenizer of the model.
+
+    If tiktoken is not available, the count is estimated with four characters per token.
+
+    Args:
+        text (str): The text to count.
+        model_name (str): Name of the OpenAI model.
+
+    Returns:
+        int: Number of tokens.
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model_name="gpt-3.5-turbo"):
+    """
+    Cut a text so that it has at most max_tokens tokens.
+
+    Args:
+        text (str): The text to truncate.
+        max_tokens (int): Maximum number of tokens.
+        model_name (str): Name of the OpenAI model.
+
+    Returns:
+        str: The truncated text.
+    """
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _split_by_tokens(text, max_tokens, model_name):
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return [text[start:start + max_tokens * 4] for start in range(0, len(text), max_tokens * 4)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), max_tokens)]
+
+
+def split_text(text, max_tokens, model_name="gpt-3.5-turbo", separators=SPLIT_SEPARATORS):
+    """
+    Split a text into chunks of at most max_tokens tokens, preferring paragraph and sentence boundaries.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int): Maximum number of tokens per chunk.
+        model_name (str): Name of the OpenAI model.
+        separators (list): Separators to split on, from the coarsest to the finest.
+
+    Returns:
+        list: The chunks of the text.
+    """
+    if count_tokens(text, model_name) <= max_tokens:
+        return [text]
+    if not separators:
+        return _split_by_tokens(text, max_tokens, model_name)
+
+    separator, finer_separators = separators[0], separators[1:]
+    chunks = []
+    current = ""
+    for piece in text.split(separator):
+        candidate = current + separator + piece if current else piece
+        if count_tokens(candidate, model_name) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        if count_tokens(piece, model_name) <= max_tokens:
+            current = piece
+        else:
+            chunks.extend(split_text(piece, max_tokens, model_name, finer_separators))
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _unit_text(sections, section_indices):
+    if len(section_indices) == 1:
+        return sections[section_indices[0]]["text"]
+    parts = []
+    for section_index in section_indices:
+        section = sections[section_index]
+        if section["text"]:
+            heading = section.get("heading") or ""
+            parts.append(f"{heading}\n{section['text']}" if heading else section["text"])
+    return "\n\n".join(parts)
+
+
+def plan_sections(sections, max_tokens, min_tokens=256, model_name="gpt-3.5-turbo"):
+    """
+    Plan the LLM calls for the sections of a paper before any request is sent.
+
+    Adjacent sections shorter than min_tokens are merged into one call as long as the merged text stays within
+    max_tokens, sections longer than max_tokens are split into several chunks.
+
+    Args:
+        sections (list): The sections of the paper as returned by science-parse.
+        max_tokens (int): Maximum number of section tokens per LLM call.
+        min_tokens (int): Sections are merged with their neighbours until they reach this size.
+        model_name (str): Name of the OpenAI model.
+
+    Returns:
+        list: The planned units, each a dict with the indices of the covered sections ("section_indices") and
+            the texts to send, one per LLM call ("chunks").
+    """
+    groups = []
+    group_tokens = 0
+    for section_index, section in enumerate(sections):
+        tokens = count_tokens(section["text"], model_name)
+        if groups and group_tokens < min_tokens and group_tokens + tokens <= max_tokens:
+            groups[-1].append(section_index)
+            group_tokens += tokens
+        else:
+            groups.append([section_index])
+            group_tokens = tokens
+
+    units = []
+    for section_indices in groups:
+        text = _unit_text(sections, section_indices)
+        chunks = split_text(text, max_tokens, model_name) if text else []
+        units.append({"section_indices": section_indices, "chunks": chunks})
+    return units
+
+
+def combine_chunk_outputs(chunk_outputs, output_keys):
+    """
+    Combine the outputs of the chunks of a split section into the outputs of one section.
+
+    Args:
+        chunk_outputs (list): The processed chunks, each a dict with the output keys.
+        output_keys (list): The keys to combine.
+
+    Returns:
+        dict: The combined outputs.
+    """
+    return {
+        output_key: "\n".join(str(output[output_key]) for output in chunk_outputs if output.get(output_key))
+        for output_key in output_keys
+    }
@@ -0,0 +1,124 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+from extractive_summary import content_words
+
+# Sections with these headings never contain anything about hallucinations
+SKIP_HEADINGS = re.compile(
+    r"acknowledg|author contributions?|contributions of the authors|funding|conflicts? of interest|"
+    r"competing interests?|ethics statement|references|bibliography|reproducibility checklist", re.IGNORECASE)
+# Sections with these headings carry the story of the paper and are always summarized by the LLM
+KEEP_HEADINGS = re.compile(
+    r"abstract|introduction|conclusions?|method|approach|experiment|results?|evaluation|discussion", re.IGNORECASE)
+# Word stems of the topics the prompts ask for and their weights
+KEYWORD_WEIGHTS = {
+    "hallucinat": 3.0, "mitigat": 3.0, "faithful": 2.0, "factual": 2.0, "metric": 2.0, "fabricat": 2.0,
+    "verif": 1.5, "retriev": 1.5, "ground": 1.5, "consisten": 1.0, "evaluat": 1.0, "benchmark": 1.0,
+    "accuracy": 1.0, "precision": 1.0, "recall": 1.0, "rouge": 1.0, "bleu": 1.0, "bertscore": 1.0, "entail": 1.0,
+    "annotat": 1.0, "human": 0.5, "error": 0.5, "reduc": 0.5,
+}
+KEYWORDS = list(KEYWORD_WEIGHTS)
+KEYWORD_PATTERN = re.compile(r"\b(" + "|".join(KEYWORDS) + r")", re.IGNORECASE)
+
+DECISIONS = ["llm", "extractive", "skip"]
+
+
+def keyword_counts(texts):
+    """
+    Count the keyword stems of every text.
+
+    Args:
+        texts (list of str): The texts.
+
+    Returns:
+        np.ndarray: One row per text and one column per entry of KEYWORDS.
+    """
+    counts = np.zeros((len(texts), len(KEYWORDS)), dtype=np.float32)
+    columns = {keyword: column for column, keyword in enumerate(KEYWORDS)}
+    for row, text in enumerate(texts):
+        for keyword, count in Counter(match.lower() for match in KEYWORD_PATTERN.findall(text)).items():
+            counts[row, columns[keyword]] = count
+    return counts
+
+
+def relevance_scores(texts):
+    """
+    Score how much each text is about hallucination metrics and mitigation techniques.
+
+    The score is a TF-IDF weighted keyword density: the keyword counts are dampened logarithmically, weighted by
+    KEYWORD_WEIGHTS and by their inverse document frequency among the given texts (a keyword in every section of a
+    paper on hallucinations says little about a single section), and divided by the square root of the number of
+    content words in hundreds.
+
+    Args:
+        texts (list of str): The texts, e.g. all sections of a paper.
+
+    Returns:
+        np.ndarray: The score of every text.
+    """
+    if not texts:
+        return np.zeros(0, dtype=np.float32)
+    counts = keyword_counts(texts)
+    n_words = np.array([max(1, len(content_words(text))) for text in texts], dtype=np.float32)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    weights = np.array([KEYWORD_WEIGHTS[keyword] for keyword in KEYWORDS], dtype=np.float32)
+    # Dividing by the square root of the length makes long sections need more hits than short ones without
+    # penalizing them linearly
+    return (np.log1p(counts) * idf * weights).sum(axis=1) / np.sqrt(n_words / 100)
+
+
+def letter_ratio(text):
+    """
+    Return the share of letters among the non-whitespace characters of a text, low for tables and formulas.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        float: The share between 0 and 1.
+    """
+    characters = re.sub(r"\s", "", text)
+    if not characters:
+        return 0.0
+    return sum(character.isalpha() for character in characters) / len(characters)
+
+
+def triage_sections(sections, threshold=1.0, min_letter_ratio=0.5):
+    """
+    Decide locally for every section whether it is summarized by the LLM, summarized extractively or skipped.
+
+    Sections with boilerplate headings (acknowledgements, funding, references, ...) and sections that are mostly
+    numbers or symbols are skipped. Sections with core headings (introduction, method, results, ...) always go to
+    the LLM. All other sections go to the LLM only if their relevance score reaches threshold and get a local
+    extractive summary otherwise.
+
+    Args:
+        sections (list): The sections of the paper as returned by science-parse.
+        threshold (float): Minimum relevance score of a section without core heading to be sent to the LLM.
+        min_letter_ratio (float): Sections with a smaller share of letters are skipped.
+
+    Returns:
+        list of dict: One decision per section with "decision" (one of DECISIONS), "score" and "reason".
+    """
+    texts = [section.get("text") or "" for section in sections]
+    scores = relevance_scores(texts)
+    decisions = []
+    for section, text, score in zip(sections, texts, scores):
+        heading = section.get("heading") or ""
+        if not text:
+            decision, reason = "skip", "empty"
+        elif SKIP_HEADINGS.search(heading):
+            decision, reason = "skip", "boilerplate heading"
+        elif letter_ratio(text) < min_letter_ratio:
+            decision, reason = "skip", "mostly numbers or symbols"
+        elif KEEP_HEADINGS.search(heading):
+            decision, reason = "llm", "core heading"
+        elif score >= threshold:
+            decision, reason = "llm", "relevant"
+        else:
+            decision, reason = "extractive", "low relevance"
+        decisions.append({"decision": decision, "score": round(float(score), 3), "reason": reason})
+    return decisions
@@ -0,0 +1,346 @@
+import argparse
+import queue
+import threading
+import time
+
+import arxiv
+
+import instrumentation
+import main as pipeline
+from corpus_store import CorpusStore
+from download_papers_by_keywords import sort_criterions_arxiv
+from downloader import create_session, download_paper
+from parse_cache import parse_pdf_cached
+from parse_pool import DEFAULT_ENDPOINTS, ParseBackendPool
+
+# Put into a queue after the last item of the previous stage
+END = object()
+
+
+class Stage:
+    """
+    One stage of the streaming pipeline: worker threads taking items from an inbox queue and putting their results
+    into an outbox queue.
+
+    The queues are bounded, so a stage that is faster than the next one blocks once the outbox is full instead of
+    piling up work (backpressure). A function returning None or raising drops the item. When the previous stage is
+    finished, its END marker is passed on once all workers of this stage are done.
+    """
+
+    def __init__(self, name, function, workers, inbox, outbox=None):
+        """
+        Args:
+            name (str): Name of the stage, e.g. "download".
+            function (callable): Function processing one item and returning the item for the next stage.
+            workers (int): Number of worker threads.
+            inbox (queue.Queue): Queue the items are taken from.
+            outbox (queue.Queue): Queue the results are put into. None for the last stage.
+        """
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self.started = None
+        self.finished = None
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads."""
+        self.started = time.perf_counter()
+        self._running = self.workers
+        self._threads = [threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        """Wait until all workers are done."""
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is END:
+                # Leave the marker for the other workers of this stage
+                self.inbox.put(END)
+                break
+            start = time.perf_counter()
+            try:
+                result = self.function(item)
+            except Exception as e:
+                # One failing paper must not stop the pipeline
+                print(f"{self.name} failed: {e}")
+                result = None
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.busy_time += elapsed
+                if result is None:
+                    self.failed += 1
+                else:
+                    self.processed += 1
+            if result is not None and self.outbox is not None:
+                start = time.perf_counter()
+                self.outbox.put(result)
+                with self._lock:
+                    self.blocked_time += time.perf_counter() - start
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+            if last:
+                self.finished = time.perf_counter()
+        if last and self.outbox is not None:
+            self.outbox.put(END)
+
+    def stats(self):
+        """
+        Return the counters of the stage.
+
+        Returns:
+            dict: Number of workers, processed and dropped items, seconds the workers were busy and blocked by a
+                full outbox, and the utilization of the workers while the stage was running.
+        """
+        with self._lock:
+            wall_time = ((self.finished or time.perf_counter()) - self.started) if self.started else 0.0
+            return {"workers": self.workers, "processed": self.processed, "failed": self.failed,
+                    "busy_time": self.busy_time, "blocked_time": self.blocked_time, "wall_time": wall_time,
+                    "utilization": self.busy_time / (wall_time * self.workers) if wall_time else 0.0}
+
+
+def search_arxiv(query_text, max_results, sort_criterion):
+    """
+    Search arXiv and yield the results page by page, as soon as each page arrives.
+
+    Args:
+        query_text (str): The query text for the arXiv search.
+        max_results (int): The maximum number of results to retrieve.
+        sort_criterion (str): The sort criterion, one of sort_criterions_arxiv.
+
+    Yields:
+        tuple: The title and the PDF URL of each paper.
+    """
+    search = arxiv.Search(
+        query=query_text,
+        max_results=max_results,
+        sort_by=sort_criterions_arxiv[sort_criterion],
+        sort_order=arxiv.SortOrder.Descending
+    )
+    # Small pages let the first papers move on while later pages are still requested
+    client = arxiv.Client(page_size=min(max_results or 100, 25))
+    for paper in client.results(search):
+        yield paper.title, paper.pdf_url
+
+
+def format_stats(stats):
+    """
+    Format the stage counters as a plain text table.
+
+    Args:
+        stats (dict): Mapping of the stage name to Stage.stats().
+
+    Returns:
+        str: The table.
+    """
+    columns = ["workers", "processed", "failed", "busy_time", "blocked_time", "wall_time", "utilization"]
+    lines = ["stage".ljust(10) + "".join(column.rjust(14) for column in columns)]
+    for name, stage in stats.items():
+        cells = [f"{stage[column]:.2f}" if isinstance(stage[column], float) else str(stage[column])
+                 for column in columns]
+        lines.append(name.ljust(10) + "".join(cell.rjust(14) for cell in cells))
+    return "\n".join(lines)
+
+
+def run_pipeline(papers, download_path, output_path, chains, parse_pool, download_workers=4, parse_workers=None,
+                 summarize_workers=4, queue_size=8, checkpoint_dir=None, parse_cache_dir=None,
+                 section_mode="sequential", corpus=None, triage_threshold=1.0):
+    """
+    Stream papers through the download, parse and summarize stages, each with its own workers.
+
+    Args:
+        papers (iterable): Tuples of the title and the PDF URL of each paper, e.g. from search_arxiv. It is
+            consumed lazily while the stages run, so the first papers are downloaded while later ones are searched.
+        download_path (str): The directory where the PDFs are saved.
+        output_path (str): Output directory for the JSON files of the summaries.
+        chains (dict): Chains and output parsers as returned by main.initialize_pipeline.
+        parse_pool (ParseBackendPool): The science-parse servers.
+        download_workers (int): Number of papers downloaded at the same time.
+        parse_workers (int): Number of papers parsed at the same time. None keeps all slots of all servers busy.
+        summarize_workers (int): Number of papers summarized at the same time.
+        queue_size (int): Maximum number of papers waiting between two stages.
+        checkpoint_dir (str): Directory for the per-paper checkpoints. None disables skipping and resuming.
+        parse_cache_dir (str): Directory of the science-parse result cache. None disables the cache.
+        section_mode (str): How the sections of a paper are scheduled, one of main.SECTION_MODES.
+        corpus (CorpusStore): Corpus store all papers are appended to. None writes no corpus store.
+        triage_threshold (float): Minimum relevance score of a section without core heading to be sent to the
+            LLM. None sends every section to the LLM.
+
+    Returns:
+        dict: Mapping of the stage name to its counters, see Stage.stats.
+    """
+    session = create_session(pool_size=max(1, download_workers))
+    start = time.perf_counter()
+    first_summary = []
+
+    def download(paper):
+        title, pdf_url = paper
+        return download_paper(title, pdf_url, download_path, session)
+
+    def parse(file):
+        output_dict = parse_pdf_cached(parse_pool, file, cache_dir=parse_cache_dir)
+        if output_dict is None:
+            print(f"Failed to parse {file}")
+            return None
+        return file, output_dict
+
+    def summarize(parsed_paper):
+        file, output_dict = parsed_paper
+        with instrumentation.span("paper", paper=file.stem):
+            output_file_path = pipeline.process_paper(file, chains, output_path, parse_pool, checkpoint_dir,
+                                                      parse_cache_dir, section_mode=section_mode, corpus=corpus,
+                                                      triage_threshold=triage_threshold, parsed=output_dict)
+        elapsed = time.perf_counter() - start
+        if not first_summary:
+            first_summary.append(elapsed)
+        print(f"Summarized {file.name} after {elapsed:.1f} s")
+        return output_file_path or file
+
+    search_queue = queue.Queue(maxsize=queue_size)
+    download_queue = queue.Queue(maxsize=queue_size)
+    parse_queue = queue.Queue(maxsize=queue_size)
+    stages = [
+        Stage("download", download, download_workers, search_queue, download_queue),
+        Stage("parse", parse, parse_workers or parse_pool.capacity, download_queue, parse_queue),
+        Stage("summarize", summarize, summarize_workers, parse_queue),
+    ]
+    for stage in stages:
+        stage.start()
+
+    # The search runs in this thread and feeds the first stage
+    searched = 0
+    blocked_time = 0.0
+    try:
+        for paper in papers:
+            put_start = time.perf_counter()
+            search_queue.put(paper)
+            blocked_time += time.perf_counter() - put_start
+            searched += 1
+    except Exception as e:
+        # The papers found so far are still processed
+        print(f"Search failed after {searched} papers: {e}")
+    finally:
+        search_queue.put(END)
+    search_time = time.perf_counter() - start
+    for stage in stages:
+        stage.join()
+
+    stats = {"search": {"workers": 1, "processed": searched, "failed": 0, "busy_time": search_time - blocked_time,
+                        "blocked_time": blocked_time, "wall_time": search_time,
+                        "utilization": (search_time - blocked_time) / search_time if search_time else 0.0}}
+    stats.update({stage.name: stage.stats() for stage in stages})
+    print(format_stats(stats))
+    if first_summary:
+        print(f"First summary after {first_summary[0]:.1f} s, all done after {time.perf_counter() - start:.1f} s")
+    return stats
+
+
+def main(query_text, max_results=20, sort_criterion="Relevance", download_path="literature/rag",
+         output_path="parsed_papers", download_workers=4, parse_workers=None, max_concurrent_papers=4, queue_size=8,
+         max_concurrent_llm_calls=None, llm=None, llm_cache_path=None, checkpoint_dir=None, parse_cache_dir=None,
+         parse_endpoints=None, parse_slots=2, section_mode="sequential", corpus_path=None, trace_path=None,
+         requests_per_minute=None, tokens_per_minute=None, triage_threshold=1.0):
+    """
+    Search arXiv, download, parse and summarize the results in one streaming pipeline.
+
+    Args:
+        query_text (str): The query text for the arXiv search.
+        max_results (int): The maximum number of results to retrieve.
+        sort_criterion (str): The sort criterion for the search results.
+        download_path (str): The directory where the PDFs are saved.
+        output_path (str): Output directory for the JSON files of the summaries.
+        download_workers (int): Number of papers downloaded at the same time.
+        parse_workers (int): Number of papers parsed at the same time. None keeps all slots of all servers busy.
+        max_concurrent_papers (int): Number of papers summarized at the same time.
+        queue_size (int): Maximum number of papers waiting between two stages.
+        max_concurrent_llm_calls (int): Maximum number of LLM calls in flight across all papers.
+        llm (BaseChatModel): Language model to use instead of gpt-3.5-turbo, e.g. a fake model for offline runs.
+        llm_cache_path (str): Path to the SQLite file caching the LLM responses. None disables the cache.
+        checkpoint_dir (str): Directory for the per-paper checkpoints. None disables skipping and resuming.
+        parse_cache_dir (str): Directory of the science-parse result cache. None disables the cache.
+        parse_endpoints (list of str): URLs of the science-parse servers.
+        parse_slots (int): Number of PDFs every science-parse server parses at the same time.
+        section_mode (str): How the sections of a paper are scheduled, one of main.SECTION_MODES.
+        corpus_path (str): Directory of a corpus store all papers are appended to. None writes no corpus store.
+        trace_path (str): Path to a JSONL file the timings of all stages are appended to. None disables tracing.
+        requests_per_minute (float): Requests per minute allowed for the OpenAI account. None means no limit.
+        tokens_per_minute (float): Tokens per minute allowed for the OpenAI account. None means no limit.
+        triage_threshold (float): Minimum relevance score of a section without core heading to be sent to the
+            LLM. None sends every section to the LLM.
+
+    Returns:
+        dict: Mapping of the stage name to its counters, None if the sort criterion is invalid.
+    """
+    if sort_criterion not in sort_criterions_arxiv:
+        print(f"Invalid sort criterion. Valid values are: {list(sort_criterions_arxiv.keys())}")
+        return None
+
+    if trace_path:
+        instrumentation.configure(trace_path)
+
+    chains = pipeline.initialize_pipeline(llm, max_concurrent_llm_calls, llm_cache_path,
+                                          requests_per_minute=requests_per_minute,
+                                          tokens_per_minute=tokens_per_minute)
+    parse_pool = ParseBackendPool(parse_endpoints, slots_per_backend=parse_slots)
+    corpus = CorpusStore(corpus_path) if corpus_path else None
+
+    stats = run_pipeline(search_arxiv(query_text, max_results, sort_criterion), download_path, output_path,
+                         chains, parse_pool, download_workers, parse_workers, max_concurrent_papers, queue_size,
+                         checkpoint_dir, parse_cache_dir, section_mode, corpus, triage_threshold)
+
+    pipeline.print_pipeline_stats(parse_pool)
+    if trace_path:
+        print(instrumentation.tracer.report())
+        instrumentation.tracer.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search arXiv, download, parse and summarize papers in one streaming pipeline.")
+    parser.add_argument('--query_text', type=str, default="retrieval augmented generation", help="Query text for ArXiv search")
+    parser.add_argument('--max_results', type=int, default=20, help="Maximum number of results to retrieve")
+    parser.add_argument('--sort_criterion', type=str, default="Relevance", help="Sort criterion for results")
+    parser.add_argument('--download_path', type=str, default="literature/rag", help="Directory where the PDFs are saved")
+    parser.add_argument('--output_path', type=str, default="parsed_papers", help="Output directory for JSON files")
+    parser.add_argument('--download_workers', type=int, default=4, help="Number of papers downloaded at the same time")
+    parser.add_argument('--parse_workers', type=int, default=None, help="Number of papers parsed at the same time (default: all slots of all science-parse servers)")
+    parser.add_argument('--max_concurrent_papers', type=int, default=4, help="Number of papers summarized at the same time")
+    parser.add_argument('--queue_size', type=int, default=8, help="Maximum number of papers waiting between two stages")
+    parser.add_argument('--max_concurrent_llm_calls', type=int, default=None, help="Maximum number of LLM calls in flight across all papers")
+    parser.add_argument('--requests_per_minute', type=float, default=None, help="Requests per minute allowed for the OpenAI account")
+    parser.add_argument('--tokens_per_minute', type=float, default=None, help="Tokens per minute allowed for the OpenAI account")
+    parser.add_argument('--llm_cache_path', type=str, default="llm_cache.db", help="SQLite file caching the LLM responses. Pass an empty string to disable the cache")
+    parser.add_argument('--checkpoint_dir', type=str, default="checkpoints", help="Directory for the per-paper checkpoints. Pass an empty string to reprocess every paper from scratch")
+    parser.add_argument('--parse_cache_dir', type=str, default="parse_cache", help="Directory where the science-parse results are cached. Pass an empty string to disable the cache")
+    parser.add_argument('--parse_endpoints', type=str, nargs='+', default=DEFAULT_ENDPOINTS, help="URLs of the science-parse servers; every PDF goes to the least loaded healthy one")
+    parser.add_argument('--parse_slots', type=int, default=2, help="Number of PDFs every science-parse server parses at the same time")
+    parser.add_argument('--section_mode', type=str, default="sequential", choices=pipeline.SECTION_MODES, help="How the sections of a paper are scheduled")
+    parser.add_argument('--corpus_path', type=str, default=None, help="Directory of a corpus store all papers are appended to")
+    parser.add_argument('--triage_threshold', type=float, default=1.0, help="Sections without core heading and with a lower keyword relevance score get a local extractive summary instead of an LLM call")
+    parser.add_argument('--no_triage', action='store_true', help="Send every non-empty section to the LLM")
+    parser.add_argument('--trace_path', type=str, default=None, help="JSONL file the timings and failures of all stages are appended to; a report is printed at the end")
+
+    args = parser.parse_args()
+    main(args.query_text, args.max_results, args.sort_criterion, args.download_path, args.output_path,
+         args.download_workers, args.parse_workers, args.max_concurrent_papers, args.queue_size,
+         max_concurrent_llm_calls=args.max_concurrent_llm_calls, llm_cache_path=args.llm_cache_path or None,
+         checkpoint_dir=args.checkpoint_dir or None, parse_cache_dir=args.parse_cache_dir or None,
+         parse_endpoints=args.parse_endpoints, parse_slots=args.parse_slots, section_mode=args.section_mode,
+         corpus_path=args.corpus_path, trace_path=args.trace_path, requests_per_minute=args.requests_per_minute,
+         tokens_per_minute=args.tokens_per_minute, triage_threshold=None if args.no_triage else args.triage_threshold)
@@ -0,0 +1,132 @@
+import re
+
+from arxiv_resolver import ArxivTitleResolver, normalize_title
+
+CATALOG = {
+    "2101.00001": "Retrieval-Augmented Generation for Knowledge-Intensive NLP Tasks",
+    "2101.00002": "Survey of Hallucination in Natural Language Generation",
+    "2101.00003": "SelfCheckGPT: Zero-Resource Black-Box Hallucination Detection for Generative Large Language Models",
+    "2101.00004": "FActScore: Fine-grained Atomic Evaluation of Factual Precision in Long Form Text Generation",
+    "2101.00005": "Chain-of-Verification Reduces Hallucination in Large Language Models",
+    "2101.00006": "Hallucination Detection for Large Language Models with Retrieval",
+    "2101.00007": "Hallucination Detection for Large Language Models in Dialogue",
+    "2101.00008": "Hallucination Detection for Large Language Models Revisited",
+    "2101.00009": "Hallucination Detection for Large Language Models at Scale",
+    "2101.00010": "Attention Is Not All You Need for Graph Transformers",
+}
+
+
+class StubResult:
+    """Search result with the attributes of arxiv.Result used by the resolver."""
+
+    def __init__(self, arxiv_id, title):
+        self.arxiv_id = arxiv_id
+        self.title = title
+        self.pdf_url = f"http://arxiv.org/pdf/{arxiv_id}v1"
+
+    def get_short_id(self):
+        return self.arxiv_id + "v1"
+
+
+class StubSearch:
+    """
+    Offline stand-in for arxiv_search: every `ti:"..."` term of the query returns the catalog papers sharing at
+    least half of its words, most similar first, and the results of all terms are concatenated and cut to
+    max_results like the relevance ranking of arXiv would.
+    """
+
+    def __init__(self, catalog=CATALOG):
+        self.catalog = catalog
+        self.queries = []
+
+    def __call__(self, query, max_results):
+        self.queries.append(query)
+        results = []
+        for term in re.findall(r'ti:"([^"]*)"', query):
+            words = set(term.split())
+            scored = []
+            for arxiv_id, title in self.catalog.items():
+                overlap = len(words & set(normalize_title(title).split())) / len(words)
+                if overlap >= 0.5:
+                    scored.append((-overlap, arxiv_id, title))
+            results.extend(StubResult(arxiv_id, title) for _, arxiv_id, title in sorted(scored))
+        return results[:max_results]
+
+
+def failing_search(query, max_results):
+    raise AssertionError(f"unexpected arXiv search: {query}")
+
+
+def test_titles_are_searched_in_batches():
+    search = StubSearch()
+    titles = list(CATALOG.values())[:4] + [f"Unknown paper number {i}" for i in range(21)]
+    resolver = ArxivTitleResolver(None, search=search, batch_size=10)
+
+    matches = resolver.resolve(titles)
+
+    batch_queries = [query for query in search.queries if query.count("ti:") > 1]
+    assert len(batch_queries) == 3
+    assert all(query.count("ti:") <= 10 for query in search.queries)
+    for arxiv_id, title in list(CATALOG.items())[:4]:
+        assert matches[title]["arxiv_id"] == arxiv_id + "v1"
+        assert matches[title]["pdf_url"] == f"http://arxiv.org/pdf/{arxiv_id}v1"
+    assert matches["Unknown paper number 0"] is None
+
+
+def test_bad_fuzzy_match_is_rejected():
+    search = StubSearch()
+    resolver = ArxivTitleResolver(None, search=search)
+
+    matches = resolver.resolve(["Attention Is All You Need"])
+
+    # The stub returns the graph transformer paper as first hit, but its title is not similar enough
+    assert search.queries
+    assert matches["Attention Is All You Need"] is None
+
+
+def test_matching_ignores_case_and_punctuation():
+    resolver = ArxivTitleResolver(None, search=StubSearch())
+
+    title = "chain of verification reduces hallucination in large language models."
+    assert resolver.resolve([title])[title]["arxiv_id"] == "2101.00005v1"
+
+
+def test_title_crowded_out_of_its_batch_is_searched_alone():
+    search = StubSearch()
+    resolver = ArxivTitleResolver(None, search=search, batch_size=2)
+    crowding = "Hallucination Detection for Large Language Models at Scale"
+    crowded = "Survey of Hallucination in Natural Language Generation"
+
+    matches = resolver.resolve([crowding, crowded])
+
+    # The four detection papers fill all results of the batch query, so the survey is only found on its own
+    assert search.queries[0].count("ti:") == 2
+    assert search.queries[1] == f'ti:"{normalize_title(crowded)}"'
+    assert len(search.queries) == 2
+    assert matches[crowding]["arxiv_id"] == "2101.00009v1"
+    assert matches[crowded]["arxiv_id"] == "2101.00002v1"
+
+
+def test_cache_is_reused_across_instances(tmp_path):
+    cache_path = tmp_path / "arxiv_titles.json"
+    titles = [CATALOG["2101.00001"], "A paper that is not on arXiv"]
+    first = ArxivTitleResolver(str(cache_path), search=StubSearch()).resolve(titles)
+
+    second_resolver = ArxivTitleResolver(str(cache_path), search=failing_search)
+    second = second_resolver.resolve(titles)
+
+    assert second == first
+    assert second[titles[1]] is None
+    assert second_resolver.queries == 0
+
+
+def test_failed_search_is_not_cached(tmp_path):
+    cache_path = tmp_path / "arxiv_titles.json"
+    title = CATALOG["2101.00004"]
+
+    def broken_search(query, max_results):
+        raise ConnectionError("arXiv is down")
+
+    assert ArxivTitleResolver(str(cache_path), search=broken_search).resolve([title])[title] is None
+    matches = ArxivTitleResolver(str(cache_path), search=StubSearch()).resolve([title])
+    assert matches[title]["arxiv_id"] == "2101.00004v1"
@@ -0,0 +1,55 @@
+from corpus_store import SECTIONS_FILE, CorpusStore
+
+
+def make_paper(key):
+    return {"title": f"Paper {key}", "sections": [{"heading": f"Section of {key}", "text": f"Text of {key}"}]}
+
+
+def tear_last_line(store, file_name):
+    # A process killed in the middle of an append leaves the start of a line without its newline
+    with open(store.path / file_name, "ab") as f:
+        f.write(b'[{"heading":"Section of the lost paper","summ')
+
+
+def assert_records_match(store, keys):
+    records = dict(store.iter_records(sections=True, section_text=True))
+    assert list(records) == keys
+    for key in keys:
+        assert records[key] == make_paper(key)
+        assert store.get(key) == make_paper(key)
+
+
+def test_torn_line_is_truncated_when_the_store_is_opened(tmp_path):
+    store = CorpusStore(tmp_path)
+    store.append("A", make_paper("A"))
+    tear_last_line(store, SECTIONS_FILE)
+
+    store = CorpusStore(tmp_path)
+    store.append("B", make_paper("B"))
+    store.append("C", make_paper("C"))
+
+    assert (tmp_path / SECTIONS_FILE).read_bytes().count(b"\n") == 3
+    assert_records_match(store, ["A", "B", "C"])
+    assert_records_match(CorpusStore(tmp_path), ["A", "B", "C"])
+
+
+def test_records_are_joined_by_key_behind_a_torn_line(tmp_path):
+    store = CorpusStore(tmp_path)
+    store.append("A", make_paper("A"))
+    # Torn by another writer while this store is open, so B lands on the same physical line as the torn bytes
+    tear_last_line(store, SECTIONS_FILE)
+    store.append("B", make_paper("B"))
+    store.append("C", make_paper("C"))
+
+    assert_records_match(store, ["A", "B", "C"])
+
+
+def test_latest_version_is_returned(tmp_path):
+    store = CorpusStore(tmp_path)
+    store.append("A", make_paper("A"))
+    store.append("B", make_paper("B"))
+    store.append("A", dict(make_paper("A"), title="Paper A, second version"))
+
+    records = dict(CorpusStore(tmp_path).iter_records(fields=["title"]))
+
+    assert records == {"A": {"title": "Paper A, second version"}, "B": {"title": "Paper B"}}